@@ -17,7 +17,50 @@
 from game import Directions, Actions
 import util
 
+class FeatureIndex:
+    """
+      Gives every feature key a stable integer ID, in the order the keys
+      are first seen, so that weights can live in a flat array
+    """
+    def __init__(self):
+        self.ids = {}
+        self.keys = []
+
+    def index(self, key):
+        i = self.ids.get(key)
+        if i is None:
+            i = self.ids[key] = len(self.keys)
+            self.keys.append(key)
+        return i
+
+    def __len__(self):
+        return len(self.keys)
+
 class FeatureExtractor:
+    def getFeatureIndex(self):
+        """
+          Returns the FeatureIndex numbering the keys of this extractor's features
+        """
+        if not hasattr(self, 'featureIndex'):
+            self.featureIndex = FeatureIndex()
+        return self.featureIndex
+
+    def getFeatureVector(self, state, action):
+        """
+          Returns the features as a sparse list of (feature ID, value) pairs,
+          with IDs from getFeatureIndex()
+        """
+        return self.getFeatureVectorsForActions(state, [action])[0]
+
+    def getFeatureVectorsForActions(self, state, actions):
+        """
+          Returns getFeatureVector(state, action) for each action.  By default
+          the keys of getFeaturesForActions are looked up in the index.
+        """
+        index = self.getFeatureIndex().index
+        return [[(index(key), value) for key, value in features.items()]
+                for features in self.getFeaturesForActions(state, actions)]
+
     def getFeatures(self, state, action):
         """
           Returns a dict from features to counts
@@ -26,6 +69,14 @@ class FeatureExtractor:
         """
         util.raiseNotDefined()
 
+    def getFeaturesForActions(self, state, actions):
+        """
+          Returns [self.getFeatures(state, action) for action in actions].
+          Extractors can override this to share the work that does not
+          depend on the action.
+        """
+        return [self.getFeatures(state, action) for action in actions]
+
 class IdentityExtractor(FeatureExtractor):
     def getFeatures(self, state, action):
         feats = util.Counter()
@@ -72,35 +123,66 @@ class SimpleExtractor(FeatureExtractor):
     - whether a ghost is one step away
     """
 
+    NAMES = ["bias", "#-of-ghosts-1-step-away", "eats-food", "closest-food"]
+
     def getFeatures(self, state, action):
+        return self.getFeaturesForActions(state, [action])[0]
+
+    def getFeaturesForActions(self, state, actions):
+        featuresForActions = []
+        for values in self.getFeatureVectorsForActions(state, actions):
+            features = util.Counter()
+            for i, value in values:
+                features[self.NAMES[i]] = value
+            featuresForActions.append(features)
+        return featuresForActions
+
+    def getFeatureIndex(self):
+        # the four features always have the IDs 0 to 3
+        if not hasattr(self, 'featureIndex'):
+            self.featureIndex = FeatureIndex()
+            for name in self.NAMES: self.featureIndex.index(name)
+        return self.featureIndex
+
+    def getFeatureVectorsForActions(self, state, actions):
+        self.getFeatureIndex()
         # extract the grid of food and wall locations and get the ghost locations
         food = state.getFood()
         walls = state.getWalls()
+        foodDistances = state.getFoodDistances()
+        moves = state.getMoveTable()
         ghosts = state.getGhostPositions()
-
-        features = util.Counter()
-
-        features["bias"] = 1.0
-
-        # compute the location of pacman after he takes the action
         x, y = state.getPacmanPosition()
-        dx, dy = Actions.directionToVector(action)
-        next_x, next_y = int(x + dx), int(y + dy)
-
-        # count the number of ghosts 1-step away
-        features["#-of-ghosts-1-step-away"] = sum((next_x, next_y) in Actions.getLegalNeighbors(g, walls) for g in ghosts)
-
-        # if there is no danger of ghosts then add the food feature
-        if not features["#-of-ghosts-1-step-away"] and food[next_x][next_y]:
-            features["eats-food"] = 1.0
-
-        dist = closestFood((next_x, next_y), food, walls)
-        if dist is not None:
-            # make the distance a number less than one otherwise the update
-            # will diverge wildly
-            features["closest-food"] = float(dist) / (walls.width * walls.height)
-        features.divideAll(10.0)
-        return features
+        size = float(walls.width * walls.height)
+
+        # the number of ghosts one step away from each position
+        ghostsNear = util.Counter()
+        for g in ghosts:
+            for neighbor in moves.getLegalNeighbors(g):
+                ghostsNear[neighbor] += 1
+
+        # every value is divided by 10 to keep the weight updates small
+        vectors = []
+        for action in actions:
+            # compute the location of pacman after he takes the action
+            dx, dy = Actions.directionToVector(action)
+            next_x, next_y = int(x + dx), int(y + dy)
+
+            # count the number of ghosts 1-step away
+            ghostsNext = ghostsNear[(next_x, next_y)]
+            vector = [(0, 1.0 / 10.0), (1, ghostsNext / 10.0)]
+
+            # if there is no danger of ghosts then add the food feature
+            if not ghostsNext and food[next_x][next_y]:
+                vector.append((2, 1.0 / 10.0))
+
+            dist = foodDistances.getDistance((next_x, next_y))
+            if dist is not None:
+                # make the distance a number less than one otherwise the update
+                # will diverge wildly
+                vector.append((3, float(dist) / size / 10.0))
+            vectors.append(vector)
+        return vectors
 
 class NewExtractor(FeatureExtractor):
     """
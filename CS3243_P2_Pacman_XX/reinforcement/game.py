@@ -21,7 +21,7 @@
 # For more info, see http://inst.eecs.berkeley.edu/~cs188/sp09/pacman.html
 
 from util import *
-import time, os
+import time, os, random
 import traceback
 import sys
 
@@ -161,9 +161,12 @@ class AgentState:
 
 class Grid:
     """
-    A 2-dimensional array of objects backed by a list of lists.  Data is accessed
-    via grid[x][y] where (x,y) are positions on a Pacman map with x horizontal,
-    y vertical and the origin (0,0) in the bottom left corner.
+    A 2-dimensional array of booleans backed by a single int bitset.  Data is
+    accessed via grid[x][y] where (x,y) are positions on a Pacman map with x
+    horizontal, y vertical and the origin (0,0) in the bottom left corner.
+
+    Cell (x, y) is bit x * height + y of self.bits, so equality, hashing and
+    counting work on the int and copies share it until one of them changes.
 
     The __str__ method constructs an output that is oriented like a pacman board.
     """
@@ -173,57 +176,74 @@ class Grid:
 
         self.width = width
         self.height = height
-        self.data = [[initialValue for y in range(height)] for x in range(width)]
+        self.bits = (1 << (width * height)) - 1 if initialValue else 0
         if bitRepresentation:
             self._unpackBits(bitRepresentation)
 
     def __getitem__(self, i):
-        return self.data[i]
+        if not 0 <= i < self.width: raise IndexError('Grid column out of range')
+        return GridColumn(self, i * self.height)
 
     def __setitem__(self, key, item):
-        self.data[key] = item
+        for y, value in enumerate(item):
+            self[key][y] = value
+
+    def __iter__(self):
+        for x in range(self.width):
+            yield self[x]
+
+    def __len__(self):
+        return self.width
 
     def __str__(self):
-        out = [[str(self.data[x][y])[0] for x in range(self.width)] for y in range(self.height)]
+        out = [[str(self[x][y])[0] for x in range(self.width)] for y in range(self.height)]
         out.reverse()
         return '\n'.join([''.join(x) for x in out])
 
     def __eq__(self, other):
         if other == None: return False
-        return self.data == other.data
+        return self.bits == other.bits and self.width == other.width and self.height == other.height
+
+    def __ne__(self, other):
+        return not self == other
 
     def __hash__(self):
-        # return hash(str(self))
-        base = 1
-        h = 0
-        for l in self.data:
-            for i in l:
-                if i:
-                    h += base
-                base *= 2
-        return hash(h)
+        # the same value the old list of lists version summed up cell by cell
+        return hash(self.bits)
 
     def copy(self):
         g = Grid(self.width, self.height)
-        g.data = [x[:] for x in self.data]
+        g.bits = self.bits
         return g
 
     def deepCopy(self):
         return self.copy()
 
     def shallowCopy(self):
+        return self.copy()
+
+    def copyAndClear(self, x, y):
+        """
+        Returns a copy with (x, y) set to False.
+        """
         g = Grid(self.width, self.height)
-        g.data = self.data
+        g.bits = self.bits & ~(1 << (x * self.height + y))
         return g
 
     def count(self, item =True ):
-        return sum([x.count(item) for x in self.data])
+        n = bin(self.bits).count('1')
+        if item: return n
+        return self.width * self.height - n
 
     def asList(self, key = True):
+        bits = self.bits
+        if not key: bits = ~bits & ((1 << (self.width * self.height)) - 1)
         list = []
-        for x in range(self.width):
-            for y in range(self.height):
-                if self[x][y] == key: list.append( (x,y) )
+        while bits:
+            low = bits & -bits
+            index = low.bit_length() - 1
+            list.append( (index / self.height, index % self.height) )
+            bits ^= low
         return list
 
     def packBits(self):
@@ -274,6 +294,34 @@ class Grid:
                 bools.append(False)
         return bools
 
+class GridColumn(object):
+    """
+    A view of column x of a Grid, so that grid[x][y] reads and writes its bits.
+    """
+    __slots__ = ('grid', 'offset')
+
+    def __init__(self, grid, offset):
+        self.grid = grid
+        self.offset = offset
+
+    def __getitem__(self, y):
+        if not 0 <= y < self.grid.height: raise IndexError('Grid row out of range')
+        return (self.grid.bits >> (self.offset + y)) & 1 == 1
+
+    def __setitem__(self, y, value):
+        if not 0 <= y < self.grid.height: raise IndexError('Grid row out of range')
+        if value:
+            self.grid.bits |= 1 << (self.offset + y)
+        else:
+            self.grid.bits &= ~(1 << (self.offset + y))
+
+    def __iter__(self):
+        for y in range(self.grid.height):
+            yield self[y]
+
+    def __len__(self):
+        return self.grid.height
+
 def reconstituteGrid(bitRep):
     if type(bitRep) is not type((1,2)):
         return bitRep
@@ -368,21 +416,107 @@ class Actions:
         return (x + dx, y + dy)
     getSuccessor = staticmethod(getSuccessor)
 
-class GameStateData:
+class MoveTable:
+    """
+    The legal actions and neighbours of every open cell of a maze, compiled
+    once from its walls (see Layout.getMoveTable).  Open cells are numbered in
+    x-major order: cells[(x, y)] is the number of a cell and positions[i] the
+    position of cell i.  Other positions, such as the half steps of scared
+    ghosts, fall back on the Actions methods.
+
+    The tuples returned are shared between callers and must not be changed.
+    """
+    def __init__(self, walls):
+        self.walls = walls
+        self.positions = [(x, y) for x in range(walls.width) for y in range(walls.height) if not walls[x][y]]
+        self.cells = dict([(pos, i) for i, pos in enumerate(self.positions)])
+        self.actions = []
+        self.neighbors = []
+        self.neighborCells = []
+        for pos in self.positions:
+            self.actions.append(tuple(Actions.getPossibleActions(Configuration(pos, Directions.STOP), walls)))
+            neighbors = tuple(Actions.getLegalNeighbors(pos, walls))
+            self.neighbors.append(neighbors)
+            self.neighborCells.append(tuple([self.cells[n] for n in neighbors]))
+
+    def getPossibleActions(self, config):
+        cell = self.cells.get(config.pos)
+        if cell is None: return tuple(Actions.getPossibleActions(config, self.walls))
+        return self.actions[cell]
+
+    def getLegalNeighbors(self, position):
+        cell = self.cells.get(position)
+        if cell is None: return tuple(Actions.getLegalNeighbors(position, self.walls))
+        return self.neighbors[cell]
+
+ZOBRIST_KEYS = {}
+_zobristRandom = random.Random(3243)
+
+def zobristKey(key):
     """
+    Returns the random 63 bit number standing for one fact about a state, such
+    as food at a position.  Numbers are drawn from a private generator the
+    first time a fact is seen, so the game's random stream is left alone.
+    """
+    value = ZOBRIST_KEYS.get(key)
+    if value is None:
+        value = ZOBRIST_KEYS[key] = _zobristRandom.getrandbits(63)
+    return value
+
+def agentZobristKey(index, agentState):
+    conf = agentState.configuration
+    if conf == None: return zobristKey((index, None, None, agentState.scaredTimer))
+    return zobristKey((index, conf.pos, conf.direction, agentState.scaredTimer))
+
+DIRECTION_CODES = {Directions.NORTH: 0, Directions.SOUTH: 1, Directions.EAST: 2, Directions.WEST: 3, Directions.STOP: 4}
+DIRECTION_BITS = 3
+SCARED_TIMER_BITS = 8
+
+def agentCompactKey(agentState, height):
+    """
+    Packs an agent's position, direction and scared timer into one number.
+    Positions are counted in half squares, as scared ghosts move half a square
+    at a time, and 0 stands for an agent without a configuration.
+    """
+    conf = agentState.configuration
+    if conf == None:
+        position = 0
+        direction = 0
+    else:
+        x, y = conf.pos
+        position = int(round(2 * x)) * 2 * height + int(round(2 * y)) + 1
+        direction = DIRECTION_CODES[conf.direction]
+    if agentState.scaredTimer >> SCARED_TIMER_BITS:
+        raise Exception('Scared timer %d does not fit a compact key' % agentState.scaredTimer)
+    return (position << DIRECTION_BITS | direction) << SCARED_TIMER_BITS | agentState.scaredTimer
 
+class GameStateData:
+    """
+    The hash of a state is the XOR of a Zobrist key for each agent state, food
+    and capsule.  GameState.generateSuccessor updates it from the parent's with
+    updateHash; states built any other way compute it in full when first
+    hashed.  Set GameStateData.checkHashes to compare every hash against a full
+    recomputation.
     """
+    checkHashes = False
+
     def __init__( self, prevState = None ):
         """
-        Generates a new data packet by copying information from its predecessor.
+        Generates a new data packet from its predecessor.
+
+        The food grid, capsule list and agent states are shared with the
+        predecessor and are never changed in place: the rules replace them, and
+        use getAgentStateForUpdate to copy an agent state before changing it.
         """
         if prevState != None:
-            self.food = prevState.food.shallowCopy()
-            self.capsules = prevState.capsules[:]
-            self.agentStates = self.copyAgentStates( prevState.agentStates )
+            self.food = prevState.food
+            self.capsules = prevState.capsules
+            self.agentStates = prevState.agentStates[:]
+            self._ownedAgents = [False] * len(self.agentStates)
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
+            self._foodDistances = prevState._foodDistances
 
         self._foodEaten = None
         self._foodAdded = None
@@ -391,10 +525,15 @@ class GameStateData:
         self._lose = False
         self._win = False
         self.scoreChange = 0
+        self._zobrist = None
+        self._compactKey = None
 
     def deepCopy( self ):
         state = GameStateData( self )
         state.food = self.food.deepCopy()
+        state.capsules = self.capsules[:]
+        state.agentStates = self.copyAgentStates( self.agentStates )
+        state._ownedAgents = [True] * len(state.agentStates)
         state.layout = self.layout.deepCopy()
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
@@ -408,6 +547,16 @@ class GameStateData:
             copiedStates.append( agentState.copy() )
         return copiedStates
 
+    def getAgentStateForUpdate( self, index ):
+        """
+        Returns the agent state at index, first copying it if it is still
+        shared with the predecessor.
+        """
+        if not self._ownedAgents[index]:
+            self.agentStates[index] = self.agentStates[index].copy()
+            self._ownedAgents[index] = True
+        return self.agentStates[index]
+
     def __eq__( self, other ):
         """
         Allows two states to be compared.
@@ -424,17 +573,67 @@ class GameStateData:
         """
         Allows states to be keys of dictionaries.
         """
-        for i, state in enumerate( self.agentStates ):
-            try:
-                int(hash(state))
-            except TypeError, e:
-                print e
-                #hash(state)
-        return int((hash(tuple(self.agentStates)) + 13*hash(self.food) + 113* hash(tuple(self.capsules)) + 7 * hash(self.score)) % 1048575 )
+        if self._zobrist == None:
+            self._zobrist = self.computeHash()
+        elif GameStateData.checkHashes and self._zobrist != self.computeHash():
+            raise Exception('Incremental state hash differs from a full recomputation')
+        return hash((self._zobrist, self.score))
+
+    def computeHash( self ):
+        """
+        Computes the Zobrist hash of agent states, food and capsules from scratch.
+        """
+        h = 0
+        for index, agentState in enumerate( self.agentStates ):
+            h ^= agentZobristKey( index, agentState )
+        for x, y in self.food.asList():
+            h ^= zobristKey( ('food', x, y) )
+        for capsule in self.capsules:
+            h ^= zobristKey( ('capsule', capsule) )
+        return h
+
+    def updateHash( self, prevState ):
+        """
+        Derives the hash from that of the predecessor this data packet was made
+        from, once the rules have been applied.  Only agent states copied by
+        getAgentStateForUpdate and the food or capsule eaten can differ.
+        """
+        if prevState._zobrist == None:
+            prevState._zobrist = prevState.computeHash()
+        h = prevState._zobrist
+        for index, owned in enumerate( self._ownedAgents ):
+            if owned:
+                h ^= agentZobristKey( index, prevState.agentStates[index] ) ^ agentZobristKey( index, self.agentStates[index] )
+        if self._foodEaten != None:
+            x, y = self._foodEaten
+            h ^= zobristKey( ('food', x, y) )
+        if self._capsuleEaten != None:
+            h ^= zobristKey( ('capsule', self._capsuleEaten) )
+        self._zobrist = h
+
+    def compactKey( self ):
+        """
+        Returns a number that packs the agent states, food and capsules, and
+        is the same for two data packets on one layout exactly when those are.
+        The layout and the score are left out.  It is computed on first use.
+        """
+        if self._compactKey == None:
+            layout = self.layout
+            key = self.food.bits
+            capsules = 0
+            for capsule in self.capsules:
+                capsules |= 1 << layout.capsules.index(capsule)
+            key = key << len(layout.capsules) | capsules
+            agentBits = (4 * layout.width * layout.height).bit_length() + DIRECTION_BITS + SCARED_TIMER_BITS
+            for agentState in self.agentStates:
+                key = key << agentBits | agentCompactKey(agentState, layout.height)
+            self._compactKey = key
+        return self._compactKey
 
     def __str__( self ):
         width, height = self.layout.width, self.layout.height
-        map = Grid(width, height)
+        # a list of columns of characters, Grids only hold booleans
+        map = [[' ' for y in range(height)] for x in range(width)]
         if type(self.food) == type((1,2)):
             self.food = reconstituteGrid(self.food)
         for x in range(width):
@@ -455,7 +654,9 @@ class GameStateData:
         for x, y in self.capsules:
             map[x][y] = 'o'
 
-        return str(map) + ("\nScore: %d\n" % self.score)
+        rows = [''.join([map[x][y] for x in range(width)]) for y in range(height)]
+        rows.reverse()
+        return '\n'.join(rows) + ("\nScore: %d\n" % self.score)
 
     def _foodWallStr( self, hasFood, hasWall ):
         if hasFood:
@@ -502,7 +703,12 @@ class GameStateData:
                 if numGhosts == numGhostAgents: continue # Max ghosts reached already
                 else: numGhosts += 1
             self.agentStates.append( AgentState( Configuration( pos, Directions.STOP), isPacman) )
+        self._ownedAgents = [True] * len(self.agentStates)
         self._eaten = [False for a in self.agentStates]
+        # a one item list holding the FoodDistances of this food, or None until
+        # a state asks; shared by every state with the same food, deep copies
+        # included, so agents that only see copies still fill it for the game
+        self._foodDistances = [None]
 
 try:
     import boinc
@@ -727,3 +933,55 @@ class Game:
                     self.unmute()
                     return
         self.display.finish()
+
+    def runHeadless( self ):
+        """
+        Main control loop for games without a display, such as training games.
+
+        Moves and scores are the same as with run, but there are no timeouts,
+        muting or display updates, agent hooks are looked up once per game and
+        observations are the game states themselves instead of deep copies.
+        Successor states never modify their parent, so this is safe for agents
+        that do not modify the states they are given.
+        """
+        self.numMoves = 0
+        agents = self.agents
+        for i in range(len(agents)):
+            agent = agents[i]
+            if not agent:
+                print >>sys.stderr, "Agent %d failed to load" % i
+                self._agentCrash(i, quiet=True)
+                return
+            registerInitialState = getattr(agent, 'registerInitialState', None)
+            if registerInitialState is not None:
+                registerInitialState(self.state.deepCopy())
+
+        observationFunctions = [getattr(agent, 'observationFunction', None) for agent in agents]
+        getActions = [agent.getAction for agent in agents]
+        moveHistory = self.moveHistory
+        rules = self.rules
+        agentIndex = self.startingIndex
+        numAgents = len( agents )
+        state = self.state
+
+        while not self.gameOver:
+            observationFunction = observationFunctions[agentIndex]
+            if observationFunction is not None:
+                observation = observationFunction(state)
+            else:
+                observation = state
+            action = getActions[agentIndex](observation)
+
+            moveHistory.append( (agentIndex, action) )
+            state = state.generateSuccessor( agentIndex, action )
+            self.state = state
+            rules.process(state, self)
+            agentIndex = ( agentIndex + 1 ) % numAgents
+
+            if _BOINC_ENABLED:
+                boinc.set_fraction_done(self.getProgress())
+
+        for agent in agents:
+            final = getattr(agent, 'final', None)
+            if final is not None:
+                final( state )
@@ -64,7 +64,7 @@ class DirectionalGhost( GhostAgent ):
         pacmanPosition = state.getPacmanPosition()
 
         # Select best actions given the state
-        distancesToPacman = [manhattanDistance( pos, pacmanPosition ) for pos in newPositions]
+        distancesToPacman = [self.getDistance( state, pos, pacmanPosition ) for pos in newPositions]
         if isScared:
             bestScore = max( distancesToPacman )
             bestProb = self.prob_scaredFlee
@@ -79,3 +79,13 @@ class DirectionalGhost( GhostAgent ):
         for a in legalActions: dist[a] += ( 1-bestProb ) / len(legalActions)
         dist.normalize()
         return dist
+
+    def getDistance( self, state, pos1, pos2 ):
+        return manhattanDistance( pos1, pos2 )
+
+class MazeGhost( DirectionalGhost ):
+    "A DirectionalGhost that measures its distance to Pacman through the maze."
+    def getDistance( self, state, pos1, pos2 ):
+        distance = state.getMazeDistances().getDistance( pos1, pos2 )
+        if distance == None: return manhattanDistance( pos1, pos2 )
+        return distance
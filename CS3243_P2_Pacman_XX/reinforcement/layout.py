@@ -13,11 +13,14 @@
 
 
 from util import manhattanDistance
-from game import Grid
+from game import Grid, MoveTable
+import mazeDistances
 import os
 import random
 
 VISIBILITY_MATRIX_CACHE = {}
+MOVE_TABLE_CACHE = {}
+MAZE_DISTANCE_CACHE = {}
 
 class Layout:
     """
@@ -35,6 +38,8 @@ class Layout:
         self.processLayoutText(layoutText)
         self.layoutText = layoutText
         self.totalFood = len(self.food.asList())
+        self.moveTable = None
+        self.mazeDistances = None
         # self.initializeVisibilityMatrix()
 
     def getNumGhosts(self):
@@ -46,7 +51,8 @@ class Layout:
             from game import Directions
             vecs = [(-0.5,0), (0.5,0),(0,-0.5),(0,0.5)]
             dirs = [Directions.NORTH, Directions.SOUTH, Directions.WEST, Directions.EAST]
-            vis = Grid(self.width, self.height, {Directions.NORTH:set(), Directions.SOUTH:set(), Directions.EAST:set(), Directions.WEST:set(), Directions.STOP:set()})
+            # a list of columns of per-cell sets, Grids only hold booleans
+            vis = [[dict([(d, set()) for d in dirs + [Directions.STOP]]) for y in range(self.height)] for x in range(self.width)]
             for x in range(self.width):
                 for y in range(self.height):
                     if self.walls[x][y] == False:
@@ -55,12 +61,35 @@ class Layout:
                             nextx, nexty = x + dx, y + dy
                             while (nextx + nexty) != int(nextx) + int(nexty) or not self.walls[int(nextx)][int(nexty)] :
                                 vis[x][y][direction].add((nextx, nexty))
-                                nextx, nexty = x + dx, y + dy
+                                nextx, nexty = nextx + dx, nexty + dy
             self.visibility = vis
             VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)] = vis
         else:
             self.visibility = VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)]
 
+    def getMoveTable(self):
+        """
+        Returns the MoveTable of this layout's walls, compiled on first use and
+        shared by every layout with the same walls.
+        """
+        if self.moveTable == None:
+            if self.walls not in MOVE_TABLE_CACHE:
+                MOVE_TABLE_CACHE[self.walls.copy()] = MoveTable(self.walls.copy())
+            self.moveTable = MOVE_TABLE_CACHE[self.walls]
+        return self.moveTable
+
+    def getMazeDistances(self):
+        """
+        Returns the MazeDistances of this layout's walls, computed or loaded
+        from disk on first use and shared like the MoveTable.
+        """
+        if self.mazeDistances == None:
+            moves = self.getMoveTable()
+            if moves.walls not in MAZE_DISTANCE_CACHE:
+                MAZE_DISTANCE_CACHE[moves.walls] = mazeDistances.MazeDistances(moves)
+            self.mazeDistances = MAZE_DISTANCE_CACHE[moves.walls]
+        return self.mazeDistances
+
     def isWall(self, pos):
         x, col = pos
         return self.walls[x][col]
@@ -14,6 +14,7 @@
 
 from game import Directions, Agent, Actions
 
+from array import array
 import random,util,time
 
 class ValueEstimationAgent(Agent):
@@ -125,12 +126,36 @@ class ReinforcementAgent(ValueEstimationAgent):
         """
             Called by environment to inform agent that a transition has
             been observed. This will result in a call to self.update
-            on the same arguments
+            on the same arguments, and with a replay buffer, to
+            self.update on replayBatch stored transitions
 
             NOTE: Do *not* override or call this function
         """
         self.episodeRewards += deltaReward
         self.update(state,action,nextState,deltaReward)
+        if self.replayBuffer != None and self.isInTraining():
+            self.replayTransitions(state,action,nextState,deltaReward)
+
+    def replayTransitions(self, state, action, nextState, reward):
+        """
+          Stores the transition and replays replayBatch transitions sampled
+          from the buffer, uniformly or, with replayPriority above 0, in
+          proportion to their last temporal difference error
+        """
+        buffer = self.replayBuffer
+        buffer.add(state, action, reward, nextState)
+        for index in buffer.sample(self.replayBatch):
+            record = buffer.get(index)
+            if buffer.priorityExponent:
+                buffer.setPriority(index, abs(self.getTDError(*record)))
+            self.update(*record)
+
+    def getTDError(self, state, action, nextState, reward):
+        """
+          The temporal difference error of a transition, used as its
+          priority in the replay buffer
+        """
+        return reward + self.discount * self.getValue(nextState) - self.getQValue(state, action)
 
     def startEpisode(self):
         """
@@ -160,7 +185,8 @@ class ReinforcementAgent(ValueEstimationAgent):
     def isInTesting(self):
         return not self.isInTraining()
 
-    def __init__(self, actionFn = None, numTraining=100, epsilon=0.5, alpha=0.5, gamma=1):
+    def __init__(self, actionFn = None, numTraining=100, epsilon=0.5, alpha=0.5, gamma=1,
+                 replaySize=0, replayBatch=1, replayPriority=0.0):
         """
         actionFn: Function which takes a state and returns the list of legal actions
 
@@ -168,7 +194,15 @@ class ReinforcementAgent(ValueEstimationAgent):
         epsilon  - exploration rate
         gamma    - discount factor
         numTraining - number of training episodes, i.e. no learning after these many episodes
+        replaySize - transitions kept for experience replay, 0 to replay none
+        replayBatch - stored transitions replayed after each training step
+        replayPriority - 0 to sample uniformly, above 0 the exponent of the
+                         priority sampling by temporal difference error
         """
+        self.replayBuffer = None
+        self.replayBatch = int(replayBatch)
+        if int(replaySize) > 0:
+            self.replayBuffer = ReplayBuffer(int(replaySize), float(replayPriority))
         if actionFn == None:
             actionFn = lambda state: state.getLegalActions()
         self.actionFn = actionFn
@@ -256,3 +290,85 @@ class ReinforcementAgent(ValueEstimationAgent):
         if self.episodesSoFar == self.numTraining:
             msg = 'Training Done (turning off epsilon and alpha)'
             print '%s\n%s' % (msg,'-' * len(msg))
+
+class ReplayBuffer:
+    """
+      A circular buffer of the last capacity transitions.  Rewards,
+      actions and sampling priorities live in flat arrays, with each
+      action stored as a small integer.  States are stored as they are
+      passed, whole GameState objects for Pacman, and terminal states need
+      no flag because update finds no legal actions in them.
+
+      With priorityExponent above 0, sample draws index i with probability
+      proportional to priority_i ** priorityExponent from a sum tree, so
+      sampling and priority updates take O(log capacity).  New
+      transitions get the largest priority seen so far.
+    """
+    def __init__(self, capacity, priorityExponent=0.0, seed=0):
+        self.capacity = capacity
+        self.priorityExponent = priorityExponent
+        self.size = 0
+        self.next = 0
+        self.states = [None] * capacity
+        self.nextStates = [None] * capacity
+        self.actions = array('H', [0]) * capacity
+        self.rewards = array('d', [0.0]) * capacity
+        self.actionIds = {}
+        self.actionList = []
+        # sum tree over the priorities: leaf i is at capacity + i
+        self.tree = array('d', [0.0]) * (2 * capacity)
+        self.maxPriority = 1.0
+        # a private generator, so replay does not change seeded games
+        self.random = random.Random(seed)
+
+    def add(self, state, action, reward, nextState):
+        i = self.next
+        if action not in self.actionIds:
+            self.actionIds[action] = len(self.actionList)
+            self.actionList.append(action)
+        self.states[i] = state
+        self.nextStates[i] = nextState
+        self.actions[i] = self.actionIds[action]
+        self.rewards[i] = reward
+        if self.priorityExponent:
+            self.setPriority(i, self.maxPriority)
+        self.next = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def get(self, i):
+        """
+          Returns transition i as (state, action, nextState, reward), in the
+          argument order of update
+        """
+        return (self.states[i], self.actionList[self.actions[i]], self.nextStates[i], self.rewards[i])
+
+    def setPriority(self, i, priority):
+        self.maxPriority = max(self.maxPriority, priority)
+        node = self.capacity + i
+        self.tree[node] = (priority + 1e-6) ** self.priorityExponent
+        node //= 2
+        while node:
+            self.tree[node] = self.tree[2 * node] + self.tree[2 * node + 1]
+            node //= 2
+
+    def sample(self, n):
+        """
+          Returns n indexes of stored transitions, drawn with replacement
+        """
+        if not self.size: return []
+        if not self.priorityExponent:
+            return [int(self.random.random() * self.size) for _ in range(n)]
+        indexes = []
+        for _ in range(n):
+            target = self.random.random() * self.tree[1]
+            node = 1
+            while node < self.capacity:
+                node *= 2
+                if target >= self.tree[node] and self.tree[node + 1] > 0:
+                    target -= self.tree[node]
+                    node += 1
+            indexes.append(node - self.capacity)
+        return indexes
+
+    def __len__(self):
+        return self.size
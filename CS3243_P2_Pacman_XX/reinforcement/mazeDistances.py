@@ -0,0 +1,212 @@
+# mazeDistances.py
+# ----------------
+# Maze distances between every pair of open cells of a layout, see
+# Layout.getMazeDistances.
+
+
+"All-pairs maze distances for Pacman layouts"
+
+from array import array
+import hashlib
+import heapq
+import os
+
+from util import manhattanDistance
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.distanceCache')
+UNREACHABLE = 0xFFFF
+
+class MazeDistances:
+    """
+    Shortest path lengths between all pairs of open cells of a maze, stored as
+    one array of n * n unsigned shorts indexed by the cell numbers of its
+    MoveTable.  The array is computed with one breadth first search per cell
+    and saved under CACHE_DIR by a hash of the walls, so later runs on the
+    same maze load it instead.
+    """
+    def __init__(self, moves, useCache = True):
+        self.moves = moves
+        self.cells = moves.cells
+        self.positions = moves.positions
+        self.size = len(moves.positions)
+        self.table = None
+        if useCache:
+            self.table = self._load()
+        if self.table == None:
+            self.table = self._compute()
+            if useCache:
+                self._save()
+
+    def getDistance(self, pos1, pos2):
+        """
+        Returns the maze distance between two positions, or None if there is
+        no path.  Positions between cells, like those of scared ghosts, add
+        their distance to the nearest open cells.
+        """
+        i = self.cells.get(pos1)
+        j = self.cells.get(pos2)
+        if i is None or j is None:
+            return self._offGridDistance(pos1, pos2)
+        d = self.table[i * self.size + j]
+        if d == UNREACHABLE: return None
+        return d
+
+    def _offGridDistance(self, pos1, pos2):
+        best = None
+        for cell1, extra1 in self._nearbyCells(pos1):
+            for cell2, extra2 in self._nearbyCells(pos2):
+                d = self.table[cell1 * self.size + cell2]
+                if d == UNREACHABLE: continue
+                d += extra1 + extra2
+                if best == None or d < best: best = d
+        return best
+
+    def _nearbyCells(self, pos):
+        x, y = pos
+        nearby = []
+        for cx in set([int(x), int(x + 0.5), int(x + 0.999)]):
+            for cy in set([int(y), int(y + 0.5), int(y + 0.999)]):
+                cell = self.cells.get((cx, cy))
+                if cell is not None: nearby.append((cell, manhattanDistance(pos, (cx, cy))))
+        return nearby
+
+    def _compute(self):
+        n = self.size
+        neighborCells = self.moves.neighborCells
+        table = array('H', [UNREACHABLE]) * (n * n)
+        for source in range(n):
+            base = source * n
+            table[base + source] = 0
+            frontier = [source]
+            d = 0
+            while frontier:
+                d += 1
+                nextFrontier = []
+                for cell in frontier:
+                    for neighbor in neighborCells[cell]:
+                        if table[base + neighbor] == UNREACHABLE:
+                            table[base + neighbor] = d
+                            nextFrontier.append(neighbor)
+                frontier = nextFrontier
+        return table
+
+    def _cachePath(self):
+        walls = self.moves.walls
+        key = hashlib.md5('%d %d %d' % (walls.width, walls.height, walls.bits)).hexdigest()
+        return os.path.join(CACHE_DIR, key + '.dist')
+
+    def _load(self):
+        path = self._cachePath()
+        if not os.path.exists(path): return None
+        table = array('H')
+        try:
+            f = open(path, 'rb')
+            try: table.fromfile(f, self.size * self.size)
+            finally: f.close()
+        except (IOError, EOFError):
+            return None
+        return table
+
+    def _save(self):
+        # written to a temporary file first, so a reader never sees half a table
+        path = self._cachePath()
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            if not os.path.isdir(CACHE_DIR): os.makedirs(CACHE_DIR)
+            f = open(tmp, 'wb')
+            try: self.table.tofile(f)
+            finally: f.close()
+            os.rename(tmp, path)
+        except (IOError, OSError):
+            pass
+
+class FoodDistances:
+    """
+    The maze distance from every open cell to its nearest food, computed once
+    by a breadth first search from all the food and then repaired as food is
+    eaten (see GameState.getFoodDistances).  Objects are never changed in
+    place, so successor states share them until a pellet is eaten.
+    """
+    def __init__(self, distances, food, field = None):
+        self.distances = distances
+        if field == None:
+            field = self._compute(food)
+        self.field = field
+
+    def getDistance(self, pos):
+        """
+        Returns the maze distance from pos to the nearest food, or None if no
+        food can be reached.
+        """
+        cell = self.distances.cells.get(pos)
+        if cell is None:
+            # not an open cell, so go through its open neighbours
+            best = None
+            for neighbor in self.distances.moves.getLegalNeighbors(pos):
+                d = self.getDistance(neighbor)
+                if d != None and (best == None or d + 1 < best): best = d + 1
+            return best
+        d = self.field[cell]
+        if d == UNREACHABLE: return None
+        return d
+
+    def withoutFood(self, pos):
+        """
+        Returns the field once the food at pos is eaten.  Only the cells that
+        pos may have been the nearest food of are searched again, starting
+        from the distances on the edge of that region.
+        """
+        distances = self.distances
+        n, table, neighborCells = distances.size, distances.table, distances.moves.neighborCells
+        eaten = distances.cells[pos]
+        base = eaten * n
+        field = self.field[:]
+
+        # the cells as close to the eaten food as to their nearest food; the
+        # next cell on a shortest path to it is one too, so they are connected
+        region = [eaten]
+        inRegion = set(region)
+        i = 0
+        while i < len(region):
+            for neighbor in neighborCells[region[i]]:
+                if neighbor not in inRegion and field[neighbor] == table[base + neighbor]:
+                    inRegion.add(neighbor)
+                    region.append(neighbor)
+            i += 1
+
+        # no food is left in the region, so paths to food leave it through its edge
+        heap = []
+        for cell in region:
+            best = UNREACHABLE
+            for neighbor in neighborCells[cell]:
+                if neighbor not in inRegion and field[neighbor] + 1 < best:
+                    best = field[neighbor] + 1
+            field[cell] = best
+            if best != UNREACHABLE: heap.append((best, cell))
+        heapq.heapify(heap)
+        while heap:
+            d, cell = heapq.heappop(heap)
+            if d > field[cell]: continue
+            for neighbor in neighborCells[cell]:
+                if neighbor in inRegion and d + 1 < field[neighbor]:
+                    field[neighbor] = d + 1
+                    heapq.heappush(heap, (d + 1, neighbor))
+        return FoodDistances(distances, None, field)
+
+    def _compute(self, food):
+        cells, neighborCells = self.distances.cells, self.distances.moves.neighborCells
+        field = array('H', [UNREACHABLE]) * self.distances.size
+        frontier = [cells[pos] for pos in food.asList()]
+        for cell in frontier:
+            field[cell] = 0
+        d = 0
+        while frontier:
+            d += 1
+            nextFrontier = []
+            for cell in frontier:
+                for neighbor in neighborCells[cell]:
+                    if field[neighbor] == UNREACHABLE:
+                        field[neighbor] = d
+                        nextFrontier.append(neighbor)
+            frontier = nextFrontier
+        return field
@@ -45,7 +45,7 @@ from game import Directions
 from game import Actions
 from util import nearestPoint
 from util import manhattanDistance
-import util, layout
+import util, layout, mazeDistances
 import sys, types, time, random, os
 
 ###################################################
@@ -71,12 +71,25 @@ class GameState:
     # Accessor methods: use these to access state data #
     ####################################################
 
-    # static variable keeps track of which states have had getLegalActions called
-    explored = set()
+    # static variable tracking the states generated, None unless trackExplored was called
+    explored = None
+    def trackExplored( sampleSize = 0 ):
+        """
+        Starts counting generated states, keeping a random sample of at most
+        sampleSize of them.  Pass None to stop tracking.
+        """
+        if sampleSize == None: GameState.explored = None
+        else: GameState.explored = ExploredStates( sampleSize )
+    trackExplored = staticmethod(trackExplored)
+
     def getAndResetExplored():
-        tmp = GameState.explored.copy()
-        GameState.explored = set()
-        return tmp
+        """
+        Returns the sampled states as a set and starts a new sample of the same size.
+        """
+        if GameState.explored == None: return set()
+        tmp = GameState.explored
+        GameState.explored = ExploredStates( tmp.sampleSize )
+        return set( tmp.sample )
     getAndResetExplored = staticmethod(getAndResetExplored)
 
     def getLegalActions( self, agentIndex=0 ):
@@ -112,7 +125,7 @@ class GameState:
         if agentIndex == 0:
             state.data.scoreChange += -TIME_PENALTY # Penalty for waiting around
         else:
-            GhostRules.decrementTimer( state.data.agentStates[agentIndex] )
+            GhostRules.decrementTimer( state.data.getAgentStateForUpdate(agentIndex) )
 
         # Resolve multi-agent effects
         GhostRules.checkDeath( state, agentIndex )
@@ -120,8 +133,9 @@ class GameState:
         # Book keeping
         state.data._agentMoved = agentIndex
         state.data.score += state.data.scoreChange
-        GameState.explored.add(self)
-        GameState.explored.add(state)
+        state.data.updateHash( self.data )
+        if GameState.explored != None:
+            GameState.explored.add(state)
         return state
 
     def getLegalPacmanActions( self ):
@@ -200,6 +214,32 @@ class GameState:
         """
         return self.data.layout.walls
 
+    def getMoveTable(self):
+        """
+        Returns the MoveTable of the layout, for fast lookups of the legal
+        actions and neighbours of a position (see game.MoveTable).
+        """
+        return self.data.layout.getMoveTable()
+
+    def getMazeDistances(self):
+        """
+        Returns the MazeDistances of the layout, for the maze distance between
+        any two positions in constant time (see mazeDistances.py).
+        """
+        return self.data.layout.getMazeDistances()
+
+    def getFoodDistances(self):
+        """
+        Returns the maze distance from each position to its nearest food, as a
+        mazeDistances.FoodDistances.  It is computed for the first state that
+        asks, copies included, then repaired as Pacman eats and shared with
+        successor states.
+        """
+        box = self.data._foodDistances
+        if box[0] == None:
+            box[0] = mazeDistances.FoodDistances( self.getMazeDistances(), self.data.food )
+        return box[0]
+
     def hasFood(self, x, y):
         return self.data.food[x][y]
 
@@ -243,6 +283,15 @@ class GameState:
         """
         return hash( self.data )
 
+    def compactKey( self ):
+        """
+        Returns a small number standing for this state, for use as a key in
+        place of the state itself.  It packs the positions, directions and
+        scared timers of the agents, the food and the capsules, but not the
+        layout or the score, so keys only tell apart states of one layout.
+        """
+        return self.data.compactKey()
+
     def __str__( self ):
 
         return str(self.data)
@@ -253,6 +302,28 @@ class GameState:
         """
         self.data.initialize(layout, numGhostAgents)
 
+class ExploredStates:
+    """
+    Counts the states added to it and keeps a uniform random sample of at most
+    sampleSize of them (reservoir sampling), so memory stays flat however many
+    states a long training run generates.
+    """
+    def __init__( self, sampleSize = 0 ):
+        self.sampleSize = sampleSize
+        self.count = 0
+        self.sample = []
+        # a private generator, so tracking does not change seeded games
+        self.random = random.Random( sampleSize )
+
+    def add( self, state ):
+        self.count += 1
+        if len( self.sample ) < self.sampleSize:
+            self.sample.append( state )
+        elif self.sampleSize:
+            index = self.random.randrange( self.count )
+            if index < self.sampleSize:
+                self.sample[index] = state
+
 ############################################################################
 #                     THE HIDDEN SECRETS OF PACMAN                         #
 #                                                                          #
@@ -331,18 +402,18 @@ class PacmanRules:
         """
         Returns a list of possible actions.
         """
-        return Actions.getPossibleActions( state.getPacmanState().configuration, state.data.layout.walls )
+        return list( state.data.layout.getMoveTable().getPossibleActions( state.getPacmanState().configuration ) )
     getLegalActions = staticmethod( getLegalActions )
 
     def applyAction( state, action ):
         """
         Edits the state to reflect the results of the action.
         """
-        legal = PacmanRules.getLegalActions( state )
+        legal = state.data.layout.getMoveTable().getPossibleActions( state.getPacmanState().configuration )
         if action not in legal:
             raise Exception("Illegal action " + str(action))
 
-        pacmanState = state.data.agentStates[0]
+        pacmanState = state.data.getAgentStateForUpdate(0)
 
         # Update Configuration
         vector = Actions.directionToVector( action, PacmanRules.PACMAN_SPEED )
@@ -361,8 +432,11 @@ class PacmanRules:
         # Eat food
         if state.data.food[x][y]:
             state.data.scoreChange += 10
-            state.data.food = state.data.food.copy()
-            state.data.food[x][y] = False
+            state.data.food = state.data.food.copyAndClear(x, y)
+            foodDistances = state.data._foodDistances[0]
+            if foodDistances != None:
+                foodDistances = foodDistances.withoutFood( position )
+            state.data._foodDistances = [foodDistances]
             state.data._foodEaten = position
             # TODO: cache numFood?
             numFood = state.getNumFood()
@@ -371,11 +445,13 @@ class PacmanRules:
                 state.data._win = True
         # Eat capsule
         if( position in state.getCapsules() ):
-            state.data.capsules.remove( position )
+            capsules = state.data.capsules[:]
+            capsules.remove( position )
+            state.data.capsules = capsules
             state.data._capsuleEaten = position
             # Reset all ghosts' scared timers
             for index in range( 1, len( state.data.agentStates ) ):
-                state.data.agentStates[index].scaredTimer = SCARED_TIME
+                state.data.getAgentStateForUpdate(index).scaredTimer = SCARED_TIME
     consume = staticmethod( consume )
 
 class GhostRules:
@@ -389,7 +465,7 @@ class GhostRules:
         reach a dead end, but can turn 90 degrees at intersections.
         """
         conf = state.getGhostState( ghostIndex ).configuration
-        possibleActions = Actions.getPossibleActions( conf, state.data.layout.walls )
+        possibleActions = list( state.data.layout.getMoveTable().getPossibleActions( conf ) )
         reverse = Actions.reverseDirection( conf.direction )
         if Directions.STOP in possibleActions:
             possibleActions.remove( Directions.STOP )
@@ -404,7 +480,7 @@ class GhostRules:
         if action not in legal:
             raise Exception("Illegal ghost action " + str(action))
 
-        ghostState = state.data.agentStates[ghostIndex]
+        ghostState = state.data.getAgentStateForUpdate(ghostIndex)
         speed = GhostRules.GHOST_SPEED
         if ghostState.scaredTimer > 0: speed /= 2.0
         vector = Actions.directionToVector( action, speed )
@@ -436,9 +512,11 @@ class GhostRules:
     def collide( state, ghostState, agentIndex):
         if ghostState.scaredTimer > 0:
             state.data.scoreChange += 200
+            ghostState = state.data.getAgentStateForUpdate(agentIndex)
             GhostRules.placeGhost(state, ghostState)
             ghostState.scaredTimer = 0
             # Added for first-person
+            state.data._eaten = state.data._eaten[:]
             state.data._eaten[agentIndex] = True
         else:
             if not state.data._win:
@@ -523,6 +601,8 @@ def readCommand( argv ):
                       help='Turns on exception handling and timeouts during games', default=False)
     parser.add_option('--timeout', dest='timeout', type='int',
                       help=default('Maximum length of time an agent can spend computing in a single game'), default=30)
+    parser.add_option('--workers', dest='workers', type='int',
+                      help='Play the test games in this many processes, each game seeded by its index', default=None)
 
     options, otherjunk = parser.parse_args(argv)
     if len(otherjunk) != 0:
@@ -570,6 +650,9 @@ def readCommand( argv ):
     args['record'] = options.record
     args['catchExceptions'] = options.catchExceptions
     args['timeout'] = options.timeout
+    if options.workers != None:
+        args['workers'] = options.workers
+        if options.fixRandomSeed: args['seed'] = 'cs188'
 
     # Special case: recorded games don't use the runGames method or args structure
     if options.gameToReplay != None:
@@ -625,14 +708,108 @@ def replayGame( layout, actions, display ):
 
     display.finish()
 
-def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30 ):
+# Layout, agents and options of the test games, set before the worker processes are forked
+_parallelGames = None
+
+def playParallelGame( task ):
+    """
+    Plays test game number index with its own seed and fresh copies of the agents,
+    so that the result does not depend on which process plays it or in what order.
+    Returns the move history.
+    """
+    index, seed = task
+    layout, pacman, ghosts, catchExceptions, timeout = _parallelGames
+    import copy, textDisplay, cStringIO
+    random.seed( seed )
+    pacman, ghosts = copy.deepcopy( (pacman, ghosts) )
+    rules = ClassicGameRules(timeout)
+    game = rules.newGame( layout, pacman, ghosts, textDisplay.NullGraphics(), True, catchExceptions)
+
+    # agent output of the workers would interleave, the parent prints the results in order
+    stdout = sys.stdout
+    sys.stdout = cStringIO.StringIO()
+    try:
+        if catchExceptions:
+            game.run()
+        else:
+            game.runHeadless()
+    finally:
+        sys.stdout = stdout
+    return game.moveHistory
+
+def canForkWorkers():
+    """
+    The workers read the agents from _parallelGames, which only forked processes
+    inherit.  Elsewhere, such as on Windows, the games are played here instead,
+    with the same seeds and so the same results.
+    """
+    import multiprocessing
+    if not hasattr(os, 'fork'): return False
+    getStartMethod = getattr(multiprocessing, 'get_start_method', None)
+    return getStartMethod == None or getStartMethod() == 'fork'
+
+def runParallelGames( layout, pacman, ghosts, display, indices, seed, workers, catchExceptions, timeout ):
+    """
+    Plays the test games with the given indices in worker processes and replays
+    their move histories here, in order, to rebuild the games and their final states.
+    """
+    global _parallelGames
+    _parallelGames = (layout, pacman, ghosts, catchExceptions, timeout)
+    tasks = [(i, '%s-%d' % (seed, i)) for i in indices]
+    if workers > 1 and len(tasks) > 1 and canForkWorkers():
+        import multiprocessing
+        pool = multiprocessing.Pool(workers)
+        try:
+            histories = pool.map(playParallelGame, tasks, 1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        histories = map(playParallelGame, tasks)
+    _parallelGames = None
+
+    rules = ClassicGameRules(timeout)
+    games = []
+    for history in histories:
+        game = rules.newGame( layout, pacman, ghosts, display, False, catchExceptions)
+        state = game.state
+        display.initialize(state.data)
+        for action in history:
+            state = state.generateSuccessor( *action )
+            display.update( state.data )
+            rules.process(state, game)
+        display.finish()
+        game.state = state
+        game.moveHistory = history
+        games.append(game)
+    return games
+
+def recordGame( layout, game, index ):
+    """
+    Writes the layout and move history of game number index for replay with -r.
+    """
+    import time, cPickle
+    fname = ('recorded-game-%d' % (index + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
+    f = file(fname, 'w')
+    components = {'layout': layout, 'actions': game.moveHistory}
+    cPickle.dump(components, f)
+    f.close()
+
+def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30, workers=None, seed=None ):
     import __main__
     __main__.__dict__['_display'] = display
 
+    import textDisplay
     rules = ClassicGameRules(timeout)
     games = []
+    if workers != None:
+        # test games are played after training, each seeded from this seed and its index
+        if seed == None: seed = random.random()
+        numSequential = min(numGames, numTraining)
+    else:
+        numSequential = numGames
 
-    for i in range( numGames ):
+    for i in range( numSequential ):
         beQuiet = i < numTraining
         if beQuiet:
                 # Suppress output and graphics
@@ -643,16 +820,20 @@ def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0
             gameDisplay = display
             rules.quiet = False
         game = rules.newGame( layout, pacman, ghosts, gameDisplay, beQuiet, catchExceptions)
-        game.run()
+        if isinstance(gameDisplay, textDisplay.NullGraphics) and not catchExceptions:
+            game.runHeadless()
+        else:
+            game.run()
         if not beQuiet: games.append(game)
 
-        if record:
-            import time, cPickle
-            fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
-            f = file(fname, 'w')
-            components = {'layout': layout, 'actions': game.moveHistory}
-            cPickle.dump(components, f)
-            f.close()
+        if record: recordGame( layout, game, i )
+
+    if numSequential < numGames:
+        parallelGames = runParallelGames( layout, pacman, ghosts, display, range(numSequential, numGames),
+                                          seed, workers, catchExceptions, timeout )
+        for i, game in zip(range(numSequential, numGames), parallelGames):
+            games.append(game)
+            if record: recordGame( layout, game, i )
 
     if (numGames-numTraining) > 0:
         scores = [game.state.getScore() for game in games]
@@ -16,8 +16,62 @@ from game import *
 from learningAgents import ReinforcementAgent
 from featureExtractors import *
 
+from array import array
 import random,util,math
 
+class QTable:
+    """
+      Q-values for (state, action) pairs.  Each state is interned to a row
+      number and each action to a column number the first time a value is
+      stored for them, and the values live in one flat array('d') of
+      rows * columns, so a state is hashed once per lookup and stored once
+      however many actions it has.  Pairs never stored have the value 0.0.
+    """
+    def __init__(self, columns=5):
+        self.stateIds = {}
+        self.actionIds = {}
+        self.columns = columns
+        self.values = array('d')
+
+    def getValue(self, state, action):
+        row = self.stateIds.get(state)
+        column = self.actionIds.get(action)
+        if row is None or column is None:
+            return 0.0
+        return self.values[row * self.columns + column]
+
+    def getValues(self, state, actions):
+        row = self.stateIds.get(state)
+        if row is None:
+            return [0.0] * len(actions)
+        base, actionIds, values = row * self.columns, self.actionIds, self.values
+        return [values[base + actionIds[action]] if action in actionIds else 0.0 for action in actions]
+
+    def setValue(self, state, action, value):
+        column = self.actionIds.get(action)
+        if column is None:
+            column = self.actionIds[action] = len(self.actionIds)
+            if column >= self.columns:
+                self.widen(2 * self.columns)
+        row = self.stateIds.get(state)
+        if row is None:
+            row = self.stateIds[state] = len(self.stateIds)
+            self.values.extend(array('d', [0.0]) * self.columns)
+        self.values[row * self.columns + column] = value
+
+    def widen(self, columns):
+        # lays the rows out again with room for more actions
+        values = array('d')
+        padding = array('d', [0.0]) * (columns - self.columns)
+        for row in range(len(self.stateIds)):
+            values.extend(self.values[row * self.columns:(row + 1) * self.columns])
+            values.extend(padding)
+        self.values = values
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.stateIds)
+
 class QLearningAgent(ReinforcementAgent):
     """
       Q-Learning Agent
@@ -43,6 +97,7 @@ class QLearningAgent(ReinforcementAgent):
         ReinforcementAgent.__init__(self, **args)
 
         "*** YOUR CODE HERE ***"
+        self.qValues = QTable()
 
     def getQValue(self, state, action):
         """
@@ -51,7 +106,14 @@ class QLearningAgent(ReinforcementAgent):
           or the Q node value otherwise
         """
         "*** YOUR CODE HERE ***"
-        util.raiseNotDefined()
+        return self.qValues.getValue(state, action)
+
+    def getQValues(self, state, actions):
+        """
+          Returns [Q(state,action) for action in actions], so that
+          subclasses can share the work of evaluating one state
+        """
+        return self.qValues.getValues(state, actions)
 
 
     def computeValueFromQValues(self, state):
@@ -62,7 +124,10 @@ class QLearningAgent(ReinforcementAgent):
           terminal state, you should return a value of 0.0.
         """
         "*** YOUR CODE HERE ***"
-        util.raiseNotDefined()
+        legalActions = self.getLegalActions(state)
+        if not legalActions:
+            return 0.0
+        return max(self.getQValues(state, legalActions))
 
     def computeActionFromQValues(self, state):
         """
@@ -71,7 +136,12 @@ class QLearningAgent(ReinforcementAgent):
           you should return None.
         """
         "*** YOUR CODE HERE ***"
-        util.raiseNotDefined()
+        legalActions = self.getLegalActions(state)
+        if not legalActions:
+            return None
+        qValues = self.getQValues(state, legalActions)
+        bestValue = max(qValues)
+        return random.choice([action for action, value in zip(legalActions, qValues) if value == bestValue])
 
     def getAction(self, state):
         """
@@ -88,7 +158,12 @@ class QLearningAgent(ReinforcementAgent):
         legalActions = self.getLegalActions(state)
         action = None
         "*** YOUR CODE HERE ***"
-        util.raiseNotDefined()
+        if not legalActions:
+            return action
+        if util.flipCoin(self.epsilon):
+            action = random.choice(legalActions)
+        else:
+            action = self.computeActionFromQValues(state)
 
         return action
 
@@ -102,7 +177,8 @@ class QLearningAgent(ReinforcementAgent):
           it will be called on your behalf
         """
         "*** YOUR CODE HERE ***"
-        util.raiseNotDefined()
+        sample = reward + self.discount * self.computeValueFromQValues(nextState)
+        self.qValues.setValue(state, action, (1 - self.alpha) * self.getQValue(state, action) + self.alpha * sample)
 
     def getPolicy(self, state):
         return self.computeActionFromQValues(state)
@@ -151,13 +227,41 @@ class ApproximateQAgent(PacmanQAgent):
        and update.  All other QLearningAgent functions
        should work as is.
     """
-    def __init__(self, extractor='IdentityExtractor', **args):
+    def __init__(self, extractor='IdentityExtractor', batchSize=1, **args):
         self.featExtractor = util.lookup(extractor, globals())()
         PacmanQAgent.__init__(self, **args)
-        self.weights = util.Counter()
+        # weights indexed by the feature IDs of the extractor's FeatureIndex,
+        # and whether each one has been updated yet
+        self.weightArray = array('d')
+        self.updated = bytearray()
+        # transitions are applied together, batchSize at a time
+        self.batchSize = int(batchSize)
+        self.batch = []
 
     def getWeights(self):
-        return self.weights
+        """
+          Returns the weights of the features updated so far, as a Counter
+          keyed by the extractor's feature keys
+        """
+        keys = self.featExtractor.getFeatureIndex().keys
+        weights = util.Counter()
+        for i, updated in enumerate(self.updated):
+            if updated: weights[keys[i]] = self.weightArray[i]
+        return weights
+
+    def dotProduct(self, vector):
+        """
+          Returns the weights times a sparse (feature ID, value) vector
+        """
+        weights = self.weightArray
+        if len(weights) < len(self.featExtractor.getFeatureIndex()):
+            self.growWeights()
+        return sum([weights[i] * value for i, value in vector])
+
+    def growWeights(self):
+        missing = len(self.featExtractor.getFeatureIndex()) - len(self.weightArray)
+        self.weightArray.extend([0.0] * missing)
+        self.updated.extend(bytearray(missing))
 
     def getQValue(self, state, action):
         """
@@ -165,14 +269,44 @@ class ApproximateQAgent(PacmanQAgent):
           where * is the dotProduct operator
         """
         "*** YOUR CODE HERE ***"
-        util.raiseNotDefined()
+        return self.dotProduct(self.featExtractor.getFeatureVector(state, action))
+
+    def getQValues(self, state, actions):
+        """
+          Evaluates every action from one pass of the feature extractor
+        """
+        return [self.dotProduct(vector) for vector in self.featExtractor.getFeatureVectorsForActions(state, actions)]
 
     def update(self, state, action, nextState, reward):
         """
            Should update your weights based on transition
         """
         "*** YOUR CODE HERE ***"
-        util.raiseNotDefined()
+        vector = self.featExtractor.getFeatureVector(state, action)
+        target = reward + self.discount * self.computeValueFromQValues(nextState)
+        self.batch.append((vector, target))
+        if len(self.batch) >= self.batchSize:
+            self.flushBatch()
+
+    def flushBatch(self):
+        """
+          Moves the weights along the mean gradient of the buffered
+          transitions, all measured against the weights before the step
+        """
+        if not self.batch: return
+        differences = [target - self.dotProduct(vector) for vector, target in self.batch]
+        weights = self.weightArray
+        step = self.alpha / len(self.batch)
+        for (vector, target), difference in zip(self.batch, differences):
+            for i, value in vector:
+                weights[i] += step * difference * value
+                self.updated[i] = 1
+        self.batch = []
+
+    def stopEpisode(self):
+        # before the end of training turns learning off
+        self.flushBatch()
+        PacmanQAgent.stopEpisode(self)
 
     def final(self, state):
         "Called at the end of each game."
@@ -1,23 +1,156 @@
 import sys
 import time
+import json
 import random
-from copy import deepcopy
+import itertools
+from array import array
 
 # Running script: given code can be run with the command:
 # python file.py, ./path/to/init_state.txt ./output/output.txt
 
+class SearchTimeout(Exception):
+    # raised by the search once Sudoku.deadline has passed, the solver must be reset before reuse
+    pass
+
+
+class Rating(object):
+    # difficulty of a puzzle, from the cheapest technique set that solved it without guessing
+    # technique is 'singles', 'subsets' or 'search', depth is the deepest nesting of guesses
+    # and nodes is the backtracking node count under Sudoku.REFERENCE_CONFIG
+    TECHNIQUES = ['singles', 'subsets', 'search']
+
+    def __init__(self, technique, depth, nodes):
+        self.technique = technique
+        self.depth = depth
+        self.nodes = nodes
+
+
+    def level(self):
+        # 0 for singles, 1 for subsets, 2 and up with each level of guessing
+        return self.TECHNIQUES.index(self.technique) + max(0, self.depth - 1)
+
+
+    def __str__(self):
+        return self.technique + " depth: " + str(self.depth) + " nodes: " + str(self.nodes)
+
+
+class SolveStats(object):
+    # counters and timings of a single solve, attached to the solver as self.stats
+    # times are in seconds, the trail is the number of pruned values waiting to be restored
+    TECHNIQUES = ['assign', 'precheck', 'forward_check', 'ac3', 'constraint1', 'subsets']
+
+    def __init__(self):
+        self.nodes = 0
+        self.backtracks = 0
+        self.max_depth = 0
+        self.prunes = dict((technique, 0) for technique in self.TECHNIQUES)
+        self.arcs = 0
+        self.arcs_revised = 0
+        self.time_propagation = 0.0
+        self.time_selection = 0.0
+        self.time_ordering = 0.0
+        self.time_total = 0.0
+        self.peak_trail = 0
+        self.budget_raised = 0      # decisions of the AC-3 PropagationBudget
+        self.budget_lowered = 0
+        self.budget_cutoffs = 0     # AC-3 runs stopped by the budget with arcs left in the queue
+        self.budget_max = 0
+        self.budget_mean = 0.0
+        self.solved = False
+
+
+    def as_dict(self):
+        return dict(self.__dict__, prunes = dict(self.prunes))
+
+
+    def to_json(self):
+        # one line of JSON, for JSON lines output
+        return json.dumps(self.as_dict(), sort_keys = True)
+
+
+class PropagationBudget(object):
+    # chooses the number of AC-3 iterations run after each assignment
+    # The limit is larger near the root, where a pruning saves the most search. After each run,
+    # the budget is doubled if the second half of the iterations found a wipeout, or a singleton
+    # once the search has backtracked, and lowered if the run was cut short finding neither.
+    # Before the first backtrack singletons are left to the next node, which is what keeps
+    # puzzles solved by singles cheap.
+    INITIAL = 23.0
+    MIN = 16.0
+    MAX = 2000.0
+    RAISE = 2.0
+    LOWER = 0.8
+    SHALLOW = 4     # depth at which the limit is 1.5 times the budget, it is twice the budget at the root
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.budget = self.INITIAL
+        self.runs = 0
+        self.total = 0
+
+
+    def limit(self, depth):
+        depth = max(0, depth)   # a negative depth would divide by zero or give a negative limit
+        limit = int(self.budget * (1 + self.SHALLOW / float(self.SHALLOW + depth)))
+        self.runs += 1
+        self.total += limit
+        self.stats.budget_max = max(self.stats.budget_max, limit)
+        self.stats.budget_mean = self.total / float(self.runs)
+        return limit
+
+
+    def observe(self, cut_off, wipeout, singleton):
+        # cut_off: arcs were left in the queue
+        # wipeout, singleton: the second half of the iterations found a wipeout or a singleton
+        if cut_off:
+            self.stats.budget_cutoffs += 1
+        if wipeout or (singleton and self.stats.backtracks):
+            self.budget = min(self.MAX, self.budget * self.RAISE)
+            self.stats.budget_raised += 1
+        elif cut_off and not singleton:
+            self.budget = max(self.MIN, self.budget * self.LOWER)
+            self.stats.budget_lowered += 1
+
+
 class Sudoku(object):
+    __slots__ = ['puzzle', 'ans', 'domains', 'trail', 'marks', 'time', 'nodes',
+                 'do_precheck', 'do_MRV', 'do_LCV', 'do_AC3', 'do_constraint1', 'do_subsets', 'do_shuffle',
+                 'do_adaptive_budget', 'budget', 'rng', 'solution', 'rating', 'guess_depth', 'max_guess_depth', 'subsets_used',
+                 'depth', 'trail_size', 'stats', 'tracer', 'deadline']
+
+    # tables that only depend on the board, built once by build_tables and shared by every instance
+    cells = []          # [pos] by cell index i * 9 + j
+    rows = dict()
+    cols = dict()
+    peers = dict()
+    neighbours = dict()
+    units = list()
+    constraints = list()
+
+    # at most one pruning of each value of each cell can be waiting to be restored
+    TRAIL_SIZE = 729
+
+    # flags used by rate so that node counts are comparable between puzzles
+    REFERENCE_CONFIG = {
+        'do_precheck': True,
+        'do_MRV': True,
+        'do_LCV': True,
+        'do_AC3': True,
+        'do_constraint1': True,
+        'do_subsets': True,
+        'do_shuffle': False,
+        'do_adaptive_budget': False,
+    }
+
     def __init__(self, puzzle):
         # you may add more attributes if you need
-        self.puzzle = puzzle # self.puzzle is a list of lists
-        self.ans = deepcopy(puzzle) # self.ans is a list of lists
+        self.puzzle = [row[:] for row in puzzle] # the only copy of the input, solved in place
+        self.ans = None # self.ans is a list of lists, the solved self.puzzle
         self.domains = dict()
-        self.pruned = dict()
-        self.rows = dict()
-        self.cols = dict()
-        self.peers = dict()
-        self.neighbours = dict()
-        self.constraints = list()
+        # prunings as cell index * 10 + value, in order, marks[cell] is where the prunings of its
+        # assignment start on the trail or -1 if it is not assigned by the search
+        self.trail = array('H', [0]) * self.TRAIL_SIZE
+        self.marks = array('h', [-1]) * 81
         self.time = time.time()
         self.nodes = 0
         self.do_precheck = True
@@ -25,41 +158,93 @@ class Sudoku(object):
         self.do_LCV = True
         self.do_AC3 = True
         self.do_constraint1 = True
+        self.do_subsets = False
+        self.do_shuffle = False
+        self.do_adaptive_budget = False # AC-3 iterations chosen by a PropagationBudget, else capped at 23
+        self.rng = None         # random.Random for do_shuffle, created when first needed
+        self.solution = None
+        self.rating = None      # set by rate()
+        self.guess_depth = 0
+        self.max_guess_depth = 0
+        self.subsets_used = False
+        self.depth = 0
+        self.trail_size = 0
+        self.stats = SolveStats()
+        self.budget = PropagationBudget(self.stats)
+        self.tracer = None      # see sudoku_trace.Tracer for the events, None costs a single check
+        self.deadline = None    # time.time() after which the search raises SearchTimeout
 
 
     def solve(self):
         # Main method called to run the alogorithm.
+        # node count, timings and other counters are left in self.stats
+        start = time.time()
         self.initialise()
 
         if self.do_precheck:
             self.precheck()
 
-        self.ans = self.backtrack(self.puzzle, self.do_AC3)
+        # self.ans is a list of lists
+        return self.search(start)
 
-        print("nodes: " + str(self.nodes))
-        print("time taken: " + str(time.time() - self.time))
 
-        # self.ans is a list of lists
+    def search(self, start = None):
+        # backtracking search from the current domains, called by solve or after reset
+        if start is None:
+            start = time.time()
+
+        self.ans = self.backtrack(self.puzzle, self.do_AC3)
+
+        self.stats.nodes = self.nodes
+        self.stats.solved = bool(self.ans)
+        self.stats.time_total = time.time() - start
         return self.ans
 
 
     def backtrack(self, puzzle, flag):
 
         self.nodes += 1
-        # self.print_puzzle()
-        # self.print_domains()
-        # if (self.nodes) > 3:
-        #     return puzzle
+        if self.deadline is not None and time.time() > self.deadline:
+            raise SearchTimeout()
+        stats = self.stats
+        stats.max_depth = max(stats.max_depth, self.depth)
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.node(self.depth)
 
         if (self.isComplete(puzzle)):
+            if tracer is not None:
+                tracer.solution(self.nodes)
             return puzzle
 
+        start = time.time()
         pos = self.select_unassigned_var(puzzle)
+        stats.time_selection += time.time() - start
+
+        if self.do_subsets and not self.guess_depth and len(self.domains[pos]) > 1:
+            # singles are stuck before any guess, try naked subsets first
+            start = time.time()
+            revised = self.naked_subsets(puzzle)
+            stats.time_propagation += time.time() - start
+            if revised:
+                self.subsets_used = True
+                pos = self.select_unassigned_var(puzzle)
 
         if not self.domains[pos]:
+            if tracer is not None:
+                tracer.wipeout(pos)
             return False
 
-        for val in self.ordered_domain_values(puzzle, pos):
+        guess = len(self.domains[pos]) > 1
+        if guess:
+            self.guess_depth += 1
+            self.max_guess_depth = max(self.max_guess_depth, self.guess_depth)
+
+        start = time.time()
+        values = self.ordered_domain_values(puzzle, pos)
+        stats.time_ordering += time.time() - start
+
+        for val in values:
 
             if self.is_having_conflits(puzzle, pos, val):
                 continue
@@ -69,21 +254,165 @@ class Sudoku(object):
                 result = self.backtrack(puzzle, flag)
 
                 if result:
+                    if guess:
+                        self.guess_depth -= 1
                     return result
             
             self.unassign(puzzle, pos, val)
+            stats.backtracks += 1
+            if tracer is not None:
+                tracer.backtrack(pos, val, self.depth)
 
+        if guess:
+            self.guess_depth -= 1
         return False
+
+
+    def rate(self):
+        # solve under the reference configuration and rate the puzzle in the same pass
+        # returns the rating, the answer is in self.ans as usual
+        # self.rating is only set here, so its node count is always one under REFERENCE_CONFIG
+        # the instance's own flags are restored afterwards
+        saved = dict((flag, getattr(self, flag)) for flag in self.REFERENCE_CONFIG)
+        try:
+            for flag, value in self.REFERENCE_CONFIG.items():
+                setattr(self, flag, value)
+            self.solve()
+            self.rating = self.get_rating()
+        finally:
+            for flag, value in saved.items():
+                setattr(self, flag, value)
+        return self.rating
+
+
+    def get_rating(self):
+        if self.max_guess_depth:
+            technique = 'search'
+        elif self.subsets_used:
+            technique = 'subsets'
+        else:
+            technique = 'singles'
+        return Rating(technique, self.max_guess_depth, self.nodes)
+
+
+    def naked_subsets(self, puzzle):
+        # if k unassigned cells of a unit share only k values between them,
+        # those values can be removed from every other cell of the unit
+        # only called before the first guess, so the prunings never need to be undone
+        revised = False
+        for unit in self.units:
+            cells = [p for p in unit if puzzle[p[0]][p[1]] == 0]
+            for k in (2, 3):
+                for group in itertools.combinations(cells, k):
+                    values = set()
+                    for p in group:
+                        values.update(self.domains[p])
+                    if len(values) != k:
+                        continue
+                    for p in cells:
+                        if p in group:
+                            continue
+                        for v in values:
+                            if v in self.domains[p]:
+                                self.domains[p].remove(v)
+                                revised = True
+                                self.stats.prunes['subsets'] += 1
+                                if self.tracer is not None:
+                                    self.tracer.prune(p, v, 'subsets')
+        return revised
     
 
+    def count_solutions(self, limit = 2):
+        # count the solutions of self.puzzle, stopping early once limit solutions are found
+        # every assignment is undone before returning, the first solution is kept in self.solution
+        self.solution = None
+        return self.count_backtrack(self.puzzle, self.do_AC3, limit)
+
+
+    def count_backtrack(self, puzzle, flag, limit):
+        self.nodes += 1
+        if self.deadline is not None and time.time() > self.deadline:
+            raise SearchTimeout()
+        stats = self.stats
+        stats.max_depth = max(stats.max_depth, self.depth)
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.node(self.depth)
+
+        if (self.isComplete(puzzle)):
+            if tracer is not None:
+                tracer.solution(self.nodes)
+            if self.solution is None:
+                self.solution = [row[:] for row in puzzle]
+            return 1
+
+        start = time.time()
+        pos = self.select_unassigned_var(puzzle)
+        stats.time_selection += time.time() - start
+
+        if not self.domains[pos]:
+            if tracer is not None:
+                tracer.wipeout(pos)
+            return 0
+
+        count = 0
+        start = time.time()
+        values = list(self.ordered_domain_values(puzzle, pos))
+        stats.time_ordering += time.time() - start
+
+        for val in values:
+
+            if self.is_having_conflits(puzzle, pos, val):
+                continue
+
+            if self.assign(puzzle, pos, val, flag):
+                count += self.count_backtrack(puzzle, flag, limit - count)
+
+            self.unassign(puzzle, pos, val)
+            stats.backtracks += 1
+            if tracer is not None:
+                tracer.backtrack(pos, val, self.depth)
+
+            if count >= limit:
+                break
+
+        return count
+
+
+    def reset(self, puzzle):
+        # start over on a new puzzle, only the domains and the trail are rebuilt
+        # call search next to solve it
+        self.puzzle = [row[:] for row in puzzle]
+        self.nodes = 0
+        self.solution = None
+        self.rating = None
+        self.guess_depth = 0
+        self.max_guess_depth = 0
+        self.subsets_used = False
+        self.depth = 0
+        self.trail_size = 0
+        self.stats = SolveStats()
+        self.budget = PropagationBudget(self.stats)
+        self.initialise_domains()
+
+        if self.do_precheck:
+            self.precheck()
+
+
     def precheck(self):
         # remove assigned value from neighbour cells of all assigned cells
+        puzzle = self.puzzle
+        start = time.time()
         for i in range(9):
             for j in range(9):
                 if puzzle[i][j] != 0:
                     for nb in self.neighbours[(i, j)]:
                         if puzzle[i][j] in self.domains[nb]:
                             self.domains[nb].remove(puzzle[i][j])
+                            self.stats.prunes['precheck'] += 1
+                            if self.tracer is not None:
+                                self.tracer.prune(nb, puzzle[i][j], 'precheck')
+        self.stats.time_propagation += time.time() - start
 
 
     def isComplete(self, puzzle):
@@ -119,6 +448,14 @@ class Sudoku(object):
         if len(self.domains[pos]) == 1:
             return self.domains[pos]
 
+        if self.do_shuffle:
+            # random value order, used to generate random complete grids
+            values = list(self.domains[pos])
+            if self.rng is None:
+                self.rng = random.Random()
+            self.rng.shuffle(values)
+            return values
+
         if self.do_LCV:
             return sorted(self.domains[pos], key = lambda val: self.conflicts(puzzle, pos, val))
         
@@ -141,44 +478,83 @@ class Sudoku(object):
 
 
     def assign(self, puzzle, pos, val, flag = False):
-        # print("assigning: " + str(pos) + ": " + str(val))
         puzzle[pos[0]][pos[1]] = val
+        self.depth += 1
+        self.marks[pos[0] * 9 + pos[1]] = self.trail_size
+        stats = self.stats
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.assign(pos, val, self.depth)
 
         for v in self.domains[pos]:
             if v != val:
                 self.domains[pos].remove(v)
-                self.pruned[pos].append((pos, v))
+                self.push(pos, v)
+                stats.prunes['assign'] += 1
+                if tracer is not None:
+                    tracer.prune(pos, v, 'assign')
+
+        start = time.time()
+        result = self.forward_check(puzzle, pos, val, flag)
+        stats.time_propagation += time.time() - start
 
-        return self.forward_check(puzzle, pos, val, flag)
+        stats.peak_trail = max(stats.peak_trail, self.trail_size)
+        return result
+
+
+    def push(self, pos, val):
+        # record a pruning of the current assignment on the trail
+        self.trail[self.trail_size] = (pos[0] * 9 + pos[1]) * 10 + val
+        self.trail_size += 1
 
 
     def forward_check(self, puzzle, pos, val, flag = False):
         # forward checks for domain reductions
+        tracer = self.tracer
         if flag:
             # perform ac3 algo
-            count = 23    # limits the number of iterations of ac3 checks to reduce time spent
+            # limits the number of iterations of ac3 checks to reduce time spent
+            adaptive = self.do_adaptive_budget
+            count = self.budget.limit(self.depth) if adaptive else 23
+            second_half = count // 2    # count left when the second half of the iterations starts
+            singleton = False
         
             queue = [(xk, pos) for xk in self.neighbours[pos]]
             while count and queue:
                 xi, xj = queue.pop(0)
                 if self.revise(xi, xj, pos):
                     if not self.domains[xi]:
+                        if adaptive:
+                            self.budget.observe(bool(queue), count <= second_half, singleton)
+                        if tracer is not None:
+                            tracer.wipeout(xi)
                         return False
+                    if count <= second_half and len(self.domains[xi]) == 1:
+                        singleton = True
                     for xk in self.neighbours[xi]:
                         queue.append((xk, xi))
                 count -= 1
+            if adaptive:
+                self.budget.observe(bool(queue), False, singleton)
         else:
             # perform forward checking algo
             for neighbour in self.neighbours[pos]:
                 if puzzle[neighbour[0]][neighbour[1]] == 0:
                     if val in self.domains[neighbour]:
                         self.domains[neighbour].remove(val)
-                        self.pruned[pos].append((neighbour, val))
+                        self.push(neighbour, val)
+                        self.stats.prunes['forward_check'] += 1
+                        if tracer is not None:
+                            tracer.prune(neighbour, val, 'forward_check')
         
         if self.do_constraint1:
             revised = False
             visited = set()
-            for p, v in self.pruned[pos]:
+            # the prunings of this assignment, including those made by this loop
+            k = self.marks[pos[0] * 9 + pos[1]]
+            while k < self.trail_size:
+                v = self.trail[k] % 10
+                k += 1
                 if v in visited:
                     continue
                 if self.puzzle[pos[0]][pos[1]] == v:
@@ -190,6 +566,7 @@ class Sudoku(object):
                 for p1 in self.rows[pos[0]]:
                     if p1 != pos and v in self.domains[p1]:
                         if len(self.domains[p1]) == 1:
+                            count = 0
                             break
                         count += 1
                         if count == 1:
@@ -198,9 +575,11 @@ class Sudoku(object):
                     for v1 in self.domains[selected]:
                         if v1 != v:
                             self.domains[selected].remove(v1)
-                            if pos:
-                                self.pruned[pos].append((selected, v1))
+                            self.push(selected, v1)
                             revised = True
+                            self.stats.prunes['constraint1'] += 1
+                            if tracer is not None:
+                                tracer.prune(selected, v1, 'constraint1')
                 
                 count = 0
                 for p1 in self.cols[pos[1]]:
@@ -216,9 +595,11 @@ class Sudoku(object):
                     for v1 in self.domains[selected]:
                         if v1 != v:
                             self.domains[selected].remove(v1)
-                            if pos:
-                                self.pruned[pos].append((selected, v1))
+                            self.push(selected, v1)
                             revised = True
+                            self.stats.prunes['constraint1'] += 1
+                            if tracer is not None:
+                                tracer.prune(selected, v1, 'constraint1')
             if revised:
                 return self.forward_check(puzzle, pos, val, flag)
 
@@ -227,14 +608,19 @@ class Sudoku(object):
 
     def unassign(self, puzzle, pos, val):
         # unassign value from cell and return pruned values back to domains
-        # print("unassigning")
+        # assignments are undone in reverse order, so its prunings are the top of the trail
         if puzzle[pos[0]][pos[1]] != 0:
-            for neighbour, val in self.pruned[pos]:
-                self.domains[neighbour].append(val)
-
-            self.pruned[pos] = []
+            c = pos[0] * 9 + pos[1]
+            mark = self.marks[c]
+            if mark >= 0:
+                for k in range(mark, self.trail_size):
+                    entry = self.trail[k]
+                    self.domains[self.cells[entry // 10]].append(entry % 10)
+                self.trail_size = mark
+                self.marks[c] = -1
 
             puzzle[pos[0]][pos[1]] = 0
+            self.depth -= 1
 
 
     def ac3(self, puzzle):
@@ -255,14 +641,21 @@ class Sudoku(object):
         # revise the pair of cells xi and xj
         # for value in domain of xi, if value not consistent with domain of xj, remove value
         revised = False
+        self.stats.arcs += 1
         
         d = self.domains[xj]
         if len(d) == 1:
             if d[0] in self.domains[xi]:
                 self.domains[xi].remove(d[0])
                 if pos:
-                    self.pruned[pos].append((xi, d[0]))
+                    self.push(xi, d[0])
                 revised = True
+                self.stats.arcs_revised += 1
+                self.stats.prunes['ac3'] += 1
+                if self.tracer is not None:
+                    self.tracer.prune(xi, d[0], 'ac3')
+        if self.tracer is not None:
+            self.tracer.revise(xi, xj, revised)
         return revised
 
 
@@ -302,42 +695,64 @@ class Sudoku(object):
 
     
     def initialise(self):
-        # Set up domains dict (i, j) -> [values]
+        # Set up domains dict (i, j) -> [values] and an empty trail
+        # The shared tables are built by the first instance to get here
+        if not Sudoku.neighbours:
+            Sudoku.build_tables()
+        self.initialise_domains()
+
+
+    @classmethod
+    def build_tables(cls):
         # Set up rows dict, cols dict i -> [pos] and peers dict (i, j) -> [pos]
-        # Set up empty pruned list
+        cls.cells = [(i, j) for i in range(9) for j in range(9)]
         for i in range(9):
             for j in range(9):
-                if self.puzzle[i][j] != 0:
-                    self.domains[(i, j)] = [self.puzzle[i][j],]
-                else:
-                    self.domains[(i, j)] = [x for x in range(1, 10)]
-                self.peers[(i, j)] = self.get_peers((i, j))
-                self.pruned[(i, j)] = []
-            self.rows[i] = self.get_row(i)
-            self.cols[i] = self.get_col(i)
+                cls.peers[(i, j)] = cls.get_peers((i, j))
+            cls.rows[i] = cls.get_row(i)
+            cls.cols[i] = cls.get_col(i)
 
         # Set up neighbours dict (i, j) ->[pos] from rows, cols and peers 
         for i in range(9):
             for j in range(9):
-                self.neighbours[(i, j)] = self.rows[i] + self.cols[j] + self.peers[(i, j)]
-                while (i, j) in self.neighbours[(i, j)]: self.neighbours[(i, j)].remove((i, j))
+                cls.neighbours[(i, j)] = cls.rows[i] + cls.cols[j] + cls.peers[(i, j)]
+                while (i, j) in cls.neighbours[(i, j)]: cls.neighbours[(i, j)].remove((i, j))
+
+        # Set up units list [[pos]] of every row, col and 3*3 square
+        cls.units[:] = [cls.rows[i] for i in range(9)] + [cls.cols[i] for i in range(9)]
+        cls.units += [cls.peers[(i, j)] for i in range(0, 9, 3) for j in range(0, 9, 3)]
 
         # Set up constraints list [(pos, neighbour)]
         for i in range(9):
             for j in range(9):
-                for neighbour in self.neighbours[(i, j)]:
-                    self.constraints.append(((i, j), neighbour))
+                for neighbour in cls.neighbours[(i, j)]:
+                    cls.constraints.append(((i, j), neighbour))
+
+
+    def initialise_domains(self):
+        # Set up domains dict (i, j) -> [values] from self.puzzle and empty the trail
+        for i in range(9):
+            for j in range(9):
+                if self.puzzle[i][j] != 0:
+                    self.domains[(i, j)] = [self.puzzle[i][j],]
+                else:
+                    self.domains[(i, j)] = [x for x in range(1, 10)]
+        self.trail_size = 0
+        self.marks = array('h', [-1]) * 81
 
 
-    def get_row(self, val):
+    @staticmethod
+    def get_row(val):
         return [(val, x) for x in range(9)]
 
 
-    def get_col(self, val):
+    @staticmethod
+    def get_col(val):
         return [(x, val) for x in range(9)]
 
 
-    def get_peers(self, pos):
+    @staticmethod
+    def get_peers(pos):
         # helper function
         # get a list of peers (neighbours in the same 3*3 square)
         result = []
@@ -0,0 +1,147 @@
+import os
+import json
+import mmap
+import argparse
+import multiprocessing
+
+from CS3243_P2_Sudoku_XX import Sudoku
+
+# Running script: solves every puzzle of a file, one 81 character line per puzzle ('0' or '.' for blanks)
+# python sudoku_batch.py puzzles.txt solutions.txt [--stats stats.jsonl]
+# python sudoku_batch.py puzzles.txt solutions.txt --bulk [--workers N]
+# Unsolvable puzzles are written as a line of '.'; with --stats, one JSON object per puzzle is written.
+# In bulk mode every input line must be exactly 81 characters, and the output has one
+# OUTPUT_RECORD byte record per input line at the same index.
+
+OUTPUT_RECORD = 82
+CHUNK = 1000
+
+def parse_line(line):
+    digits = [0 if c == '.' else int(c) for c in line.strip() if c == '.' or '0' <= c <= '9']
+    if len(digits) != 81:
+        return None
+    return [digits[i * 9:i * 9 + 9] for i in range(9)]
+
+
+def format_grid(ans):
+    if not ans:
+        return '.' * 81
+    return ''.join(str(val) for row in ans for val in row)
+
+
+def solve_all(lines, output, stats_output = None):
+    count = 0
+    for index, line in enumerate(lines):
+        puzzle = parse_line(line)
+        if puzzle is None:
+            continue
+
+        sudoku = Sudoku(puzzle)
+        if stats_output is None:
+            ans = sudoku.solve()
+        else:
+            # one pass under the reference configuration gives the answer, the statistics and the rating
+            rating = sudoku.rate()
+            ans = sudoku.ans
+        output.write(format_grid(ans) + "\n")
+
+        if stats_output is not None:
+            record = sudoku.stats.as_dict()
+            record['index'] = index
+            record['rating'] = rating.technique
+            record['guess_depth'] = rating.depth
+            stats_output.write(json.dumps(record, sort_keys = True) + "\n")
+        count += 1
+    return count
+
+
+def record_size(data):
+    # length of one input record, 81 characters plus a '\n' or '\r\n' line ending
+    end = data.find(b'\n')
+    if end not in (81, 82):
+        raise ValueError("Bulk input lines must be 81 characters long")
+    return end + 1
+
+
+def parse_record(record):
+    # '0' to '9' are ASCII 48 to 57, '.' is 46
+    digits = [0 if c == 46 else c - 48 for c in record]
+    if any(d < 0 or d > 9 for d in digits):
+        return None
+    return [digits[i * 9:i * 9 + 9] for i in range(9)]
+
+
+def solve_range(job):
+    # solve input records start to stop and write them at the same offsets of the output
+    # both files are mapped by the worker itself, only the range is sent to it
+    input_path, output_path, size, start, stop = job
+    with open(input_path, 'rb') as fin, open(output_path, 'r+b') as fout:
+        data = mmap.mmap(fin.fileno(), 0, access = mmap.ACCESS_READ)
+        out = mmap.mmap(fout.fileno(), 0)
+
+        solver = Sudoku([[0 for i in range(9)] for j in range(9)])
+        solver.initialise()
+        for index in range(start, stop):
+            puzzle = parse_record(data[index * size:index * size + 81])
+            ans = None
+            if puzzle is not None:
+                solver.reset(puzzle)
+                ans = solver.search()
+            out[index * OUTPUT_RECORD:(index + 1) * OUTPUT_RECORD] = (format_grid(ans) + "\n").encode('ascii')
+
+        out.flush()
+        out.close()
+        data.close()
+    return stop - start
+
+
+def solve_bulk(input_path, output_path, workers = None):
+    total = os.path.getsize(input_path)
+    count = 0
+    if total:
+        with open(input_path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+            size = record_size(data)
+            data.close()
+        # the last line may have no line ending
+        count = (total + size - 81) // size
+
+    with open(output_path, 'wb') as f:
+        f.truncate(count * OUTPUT_RECORD)
+    if not count:
+        return 0
+
+    jobs = [(input_path, output_path, size, start, min(start + CHUNK, count)) for start in range(0, count, CHUNK)]
+    if workers == 1 or len(jobs) == 1:
+        return sum(solve_range(job) for job in jobs)
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        return sum(pool.imap_unordered(solve_range, jobs))
+    finally:
+        pool.close()
+        pool.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Solve a file of sudoku puzzles")
+    parser.add_argument('input')
+    parser.add_argument('output')
+    parser.add_argument('--stats', help = "write per-solve statistics as JSON lines to this file")
+    parser.add_argument('--bulk', action = 'store_true', help = "memory-map fixed width input and output")
+    parser.add_argument('--workers', type = int, help = "worker processes in bulk mode [Default: one per CPU]")
+    args = parser.parse_args()
+
+    if args.bulk:
+        if args.stats:
+            parser.error("--stats is not supported with --bulk")
+        solve_bulk(args.input, args.output, args.workers)
+        parser.exit()
+
+    stats_output = open(args.stats, 'w') if args.stats else None
+    try:
+        with open(args.input, 'r') as f, open(args.output, 'w') as output:
+            solve_all(f, output, stats_output)
+    finally:
+        if stats_output is not None:
+            stats_output.close()
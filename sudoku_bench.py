@@ -0,0 +1,155 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+from CS3243_P2_Sudoku_XX import Sudoku
+from sudoku_batch import parse_line
+
+# Running script: benchmarks the solver over the bundled corpora and a matrix of do_* flag settings
+# python sudoku_bench.py [--corpora easy,hard] [--configs default,no_LCV] [--limit N]
+#                        [--baseline FILE] [--save-baseline] [--threshold 0.2]
+# Results are compared against the baseline file and the exit status is 1 if anything regressed.
+
+CORPORA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sudoku_corpora')
+CORPORA = ['easy', 'hard', 'seventeen']
+FLAGS = ['do_precheck', 'do_MRV', 'do_LCV', 'do_AC3', 'do_constraint1']
+
+# default settings, then each flag turned off on its own, then the opt-in adaptive AC-3 budget
+CONFIGS = dict([('default', {})] + [('no_' + flag[3:], {flag: False}) for flag in FLAGS] +
+               [('adaptive_budget', {'do_adaptive_budget': True})])
+
+# no_precheck and no_MRV take minutes per puzzle on the 17 clue corpus, so they only run when asked for
+DEFAULT_CONFIGS = ['default', 'no_LCV', 'no_AC3', 'no_constraint1']
+
+# metric -> True if higher is better
+METRICS = {
+    'nodes': False,
+    'nodes_per_sec': True,
+    'median_ms': False,
+    'p99_ms': False,
+    'peak_kib': False,
+}
+
+
+def load_corpus(name, limit = None):
+    with open(os.path.join(CORPORA_DIR, name + '.txt'), 'r') as f:
+        puzzles = [p for p in (parse_line(line) for line in f) if p is not None]
+    return puzzles[:limit] if limit else puzzles
+
+
+def percentile(values, q):
+    # nearest rank percentile of a non-empty list
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def solve(puzzle, flags):
+    sudoku = Sudoku(puzzle)
+    for flag, value in flags.items():
+        setattr(sudoku, flag, value)
+    ans = sudoku.solve()
+    return sudoku, ans
+
+
+def run_config(puzzles, flags):
+    latencies = []
+    nodes = 0
+    solved = 0
+    for puzzle in puzzles:
+        start = time.time()
+        sudoku, ans = solve(puzzle, flags)
+        latencies.append(time.time() - start)
+        nodes += sudoku.stats.nodes
+        solved += bool(ans)
+
+    # separate pass so that tracemalloc does not slow down the timed one
+    peak = 0
+    tracemalloc.start()
+    for puzzle in puzzles:
+        tracemalloc.reset_peak()
+        solve(puzzle, flags)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+
+    total = sum(latencies)
+    return {
+        'puzzles': len(puzzles),
+        'solved': solved,
+        'nodes': nodes,
+        'nodes_per_sec': nodes / total if total else 0.0,
+        'median_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'peak_kib': peak / 1024.0,
+    }
+
+
+def compare(results, baseline, threshold):
+    # returns a list of regressions worse than threshold (a fraction) relative to the baseline
+    regressions = []
+    for key, result in sorted(results.items()):
+        if key not in baseline:
+            continue
+        if result['solved'] < baseline[key]['solved']:
+            regressions.append(key + " solved " + str(result['solved']) + " < " + str(baseline[key]['solved']))
+        for metric, higher_is_better in sorted(METRICS.items()):
+            old, new = baseline[key][metric], result[metric]
+            if not old:
+                continue
+            change = (new - old) / float(old)
+            if higher_is_better:
+                change = -change
+            if change > threshold:
+                regressions.append(key + " " + metric + " " + "%.3f" % old + " -> " + "%.3f" % new +
+                                   " (" + "%+.1f" % (change * 100) + "% worse)")
+    return regressions
+
+
+def print_results(results):
+    header = "%-24s %7s %9s %12s %10s %10s %10s" % (
+        'corpus/config', 'solved', 'nodes', 'nodes/sec', 'median ms', 'p99 ms', 'peak KiB')
+    print(header)
+    print("-" * len(header))
+    for key, r in sorted(results.items()):
+        print("%-24s %3d/%-3d %9d %12.0f %10.2f %10.2f %10.1f" % (
+            key, r['solved'], r['puzzles'], r['nodes'], r['nodes_per_sec'], r['median_ms'], r['p99_ms'], r['peak_kib']))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Benchmark the sudoku solver")
+    parser.add_argument('--corpora', default = ','.join(CORPORA))
+    parser.add_argument('--configs', default = ','.join(DEFAULT_CONFIGS),
+                        help = "any of " + ', '.join(sorted(CONFIGS)))
+    parser.add_argument('--limit', type = int, help = "only use the first LIMIT puzzles of each corpus")
+    parser.add_argument('--baseline', default = os.path.join(CORPORA_DIR, 'baseline.json'))
+    parser.add_argument('--save-baseline', action = 'store_true', help = "overwrite the baseline with these results")
+    parser.add_argument('--threshold', type = float, default = 0.2, help = "allowed fraction worse than the baseline")
+    args = parser.parse_args()
+
+    results = dict()
+    for corpus in args.corpora.split(','):
+        puzzles = load_corpus(corpus, args.limit)
+        for config in args.configs.split(','):
+            results[corpus + '/' + config] = run_config(puzzles, CONFIGS[config])
+    print_results(results)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent = 2, sort_keys = True)
+        print("\nBaseline saved to " + args.baseline)
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print("\nNo baseline at " + args.baseline + ", run with --save-baseline to create one")
+        sys.exit(0)
+
+    with open(args.baseline, 'r') as f:
+        regressions = compare(results, json.load(f), args.threshold)
+    if regressions:
+        print("\nRegressions over " + "%.0f" % (args.threshold * 100) + "%:")
+        for regression in regressions:
+            print("  " + regression)
+        sys.exit(1)
+    print("\nNo regressions over " + "%.0f" % (args.threshold * 100) + "%")
@@ -0,0 +1,97 @@
+import sys
+import random
+
+from CS3243_P2_Sudoku_XX import Sudoku
+
+# Running script: generates puzzles with a unique solution, one 81 character line per puzzle
+# python sudoku_generate.py count output.txt [clues] [symmetric] [seed]
+
+class SudokuGenerator(object):
+    def __init__(self, target_clues = 24, symmetric = False, seed = None):
+        self.target_clues = target_clues
+        self.symmetric = symmetric
+        self.rng = random.Random(seed)
+
+        # a single solver is kept for every probe so its tables are only built once
+        self.solver = Sudoku(self.empty_grid())
+        self.solver.rng = self.rng
+        self.solver.initialise()
+
+
+    def empty_grid(self):
+        return [[0 for i in range(9)] for j in range(9)]
+
+
+    def full_grid(self):
+        # random complete grid found by randomised search on an empty puzzle
+        self.solver.do_shuffle = True
+        self.solver.reset(self.empty_grid())
+        self.solver.count_solutions(1)
+        self.solver.do_shuffle = False
+        return self.solver.solution
+
+
+    def is_unique(self, puzzle):
+        # early cutoff: stop searching as soon as a second solution is found
+        self.solver.reset(puzzle)
+        return self.solver.count_solutions(2) == 1
+
+
+    def removal_groups(self):
+        # cells removed together, either one at a time or paired with their 180 degree rotation
+        if self.symmetric:
+            cells = [(i, j) for i in range(9) for j in range(9)][:41]
+            groups = [sorted(set([(i, j), (8 - i, 8 - j)])) for i, j in cells]
+        else:
+            groups = [[(i, j)] for i in range(9) for j in range(9)]
+        self.rng.shuffle(groups)
+        return groups
+
+
+    def generate(self):
+        # remove clues from a random complete grid while the solution stays unique
+        # stops at target_clues, or earlier if no further clue can be removed
+        puzzle = self.full_grid()
+        clues = 81
+
+        for group in self.removal_groups():
+            if clues <= self.target_clues:
+                break
+            if clues - len(group) < self.target_clues:
+                continue
+
+            removed = [puzzle[i][j] for i, j in group]
+            for i, j in group:
+                puzzle[i][j] = 0
+
+            if self.is_unique(puzzle):
+                clues -= len(group)
+            else:
+                for (i, j), val in zip(group, removed):
+                    puzzle[i][j] = val
+
+        return puzzle
+
+
+    def stream(self, path, count):
+        # write each puzzle to disk as soon as it is generated
+        with open(path, 'a') as f:
+            for n in range(count):
+                puzzle = self.generate()
+                f.write(''.join(str(val) for row in puzzle for val in row) + "\n")
+                f.flush()
+        return count
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print ("\nUsage: python sudoku_generate.py count output.txt [clues] [symmetric] [seed]\n")
+        raise ValueError("Wrong number of arguments!")
+
+    count = int(sys.argv[1])
+    clues = int(sys.argv[3]) if len(sys.argv) > 3 else 24
+    symmetric = len(sys.argv) > 4 and sys.argv[4] in ('1', 'symmetric', 'true')
+    seed = int(sys.argv[5]) if len(sys.argv) > 5 else None
+
+    generator = SudokuGenerator(clues, symmetric, seed)
+    generator.stream(sys.argv[2], count)
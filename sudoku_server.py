@@ -0,0 +1,196 @@
+import json
+import time
+import asyncio
+import argparse
+import collections
+import concurrent.futures
+
+from CS3243_P2_Sudoku_XX import Sudoku, SearchTimeout
+from sudoku_batch import parse_line, format_grid
+
+# Running script: local solving service
+# python sudoku_server.py [--unix PATH | --host HOST --port PORT] [--workers N] [--max-pending N]
+#
+# Line protocol, one request per line, replies may come back out of order:
+#   SOLVE <id> <81 character puzzle> [deadline ms]  ->  <id> OK <81 character solution>
+#                                                       <id> NOSOLUTION | TIMEOUT | CANCELLED | ERROR <reason>
+#   CANCEL <id>                                     ->  the pending SOLVE <id> replies CANCELLED if it was still queued,
+#                                                       otherwise <id> RUNNING and the SOLVE replies when it finishes
+#   STATS                                           ->  STATS <json>
+# Once max-pending requests are in flight the server stops reading from its clients until one finishes.
+
+LATENCY_WINDOW = 10000
+
+_solver = None
+
+
+def init_worker():
+    # each worker process keeps one solver, so its tables are built once per process
+    global _solver
+    _solver = Sudoku([[0 for i in range(9)] for j in range(9)])
+    _solver.initialise()
+
+
+def conflicting_givens(puzzle):
+    # True if a row, column or box holds the same given twice
+    units = [[(i, j) for j in range(9)] for i in range(9)] + [[(i, j) for i in range(9)] for j in range(9)] + \
+            [[(r + i, c + j) for i in range(3) for j in range(3)] for r in (0, 3, 6) for c in (0, 3, 6)]
+    for unit in units:
+        values = [puzzle[i][j] for i, j in unit if puzzle[i][j] != 0]
+        if len(values) != len(set(values)):
+            return True
+    return False
+
+
+def solve_in_worker(puzzle, deadline):
+    _solver.reset(puzzle)
+    _solver.deadline = deadline
+    try:
+        ans = _solver.search()
+        return format_grid(ans) if ans else None
+    finally:
+        _solver.deadline = None
+
+
+class SolverServer(object):
+    def __init__(self, workers = None, max_pending = 64):
+        self.pool = concurrent.futures.ProcessPoolExecutor(workers, initializer = init_worker)
+        self.pending = asyncio.Semaphore(max_pending)
+        self.in_flight = 0
+        self.start = time.time()
+        self.counts = collections.Counter()
+        self.latencies = collections.deque(maxlen = LATENCY_WINDOW)
+
+
+    async def handle(self, reader, writer):
+        futures = dict()    # request id -> pool future, for CANCEL
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = line.decode('ascii', 'replace').split()
+                if not request or request[0] != 'SOLVE':
+                    await self.command(request, futures, writer)
+                    continue
+
+                self.counts['requests'] += 1
+                start = time.time()
+                try:
+                    request_id, puzzle, deadline = self.parse(request, start)
+                except ValueError as e:
+                    self.counts['errors'] += 1
+                    await self.reply(writer, (request[1] if len(request) > 1 else "?") + " ERROR " + str(e))
+                    continue
+
+                # backpressure: the next line is not read until there is room for this request
+                await self.pending.acquire()
+                self.in_flight += 1
+                future = self.pool.submit(solve_in_worker, puzzle, deadline)
+                # the slot is only given back once the worker is done, cancelled or not
+                loop = asyncio.get_event_loop()
+                future.add_done_callback(lambda f: loop.call_soon_threadsafe(self.release))
+                futures[request_id] = future
+                asyncio.ensure_future(self.finish(request_id, future, start, futures, writer))
+        finally:
+            # only queued requests can be cancelled, running ones finish in their worker
+            for future in list(futures.values()):
+                future.cancel()
+            writer.close()
+
+
+    def release(self):
+        self.in_flight -= 1
+        self.pending.release()
+
+
+    def parse(self, request, start):
+        if len(request) not in (3, 4):
+            raise ValueError("expected SOLVE <id> <puzzle> [deadline ms]")
+        puzzle = parse_line(request[2])
+        if puzzle is None:
+            raise ValueError("puzzle must have 81 cells")
+        if conflicting_givens(puzzle):
+            raise ValueError("puzzle has conflicting givens")
+        deadline = start + float(request[3]) / 1000.0 if len(request) == 4 else None
+        return request[1], puzzle, deadline
+
+
+    async def command(self, request, futures, writer):
+        if request and request[0] == 'CANCEL' and len(request) == 2:
+            # a request that has started cannot be taken back from its worker
+            if request[1] in futures and not futures[request[1]].cancel():
+                await self.reply(writer, request[1] + " RUNNING")
+        elif request and request[0] == 'STATS':
+            await self.reply(writer, "STATS " + json.dumps(self.stats(), sort_keys = True))
+        else:
+            await self.reply(writer, "? ERROR unknown command")
+
+
+    async def finish(self, request_id, future, start, futures, writer):
+        try:
+            ans = await asyncio.wrap_future(future)
+            result = "OK " + ans if ans else "NOSOLUTION"
+            self.counts['solved' if ans else 'unsolvable'] += 1
+            self.latencies.append(time.time() - start)
+        except SearchTimeout:
+            result = "TIMEOUT"
+            self.counts['timeouts'] += 1
+        except asyncio.CancelledError:
+            # only a queued request can be cancelled, it never reached a worker
+            result = "CANCELLED"
+            self.counts['cancelled'] += 1
+        except Exception as e:
+            result = "ERROR " + str(e).replace("\n", " ")
+            self.counts['errors'] += 1
+        finally:
+            if futures.get(request_id) is future:
+                del futures[request_id]
+
+        if not writer.is_closing():
+            await self.reply(writer, request_id + " " + result)
+
+
+    async def reply(self, writer, line):
+        writer.write((line + "\n").encode('ascii'))
+        await writer.drain()
+
+
+    def stats(self):
+        uptime = time.time() - self.start
+        latencies = sorted(self.latencies)
+        result = dict(self.counts)
+        result['uptime'] = uptime
+        result['in_flight'] = self.in_flight
+        result['throughput'] = (self.counts['solved'] + self.counts['unsolvable']) / uptime if uptime else 0.0
+        for name, q in (('p50_ms', 0.5), ('p90_ms', 0.9), ('p99_ms', 0.99)):
+            result[name] = latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else None
+        return result
+
+
+async def serve(args):
+    server = SolverServer(args.workers, args.max_pending)
+    if args.unix:
+        listener = await asyncio.start_unix_server(server.handle, path = args.unix)
+    else:
+        listener = await asyncio.start_server(server.handle, host = args.host, port = args.port)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.pool.shutdown(cancel_futures = True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Serve the sudoku solver on a local socket")
+    parser.add_argument('--unix', help = "listen on this Unix domain socket instead of TCP")
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 3243)
+    parser.add_argument('--workers', type = int, help = "worker processes [Default: one per CPU]")
+    parser.add_argument('--max-pending', type = int, default = 64, help = "requests in flight before reading pauses")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,112 @@
+from CS3243_P2_Sudoku_XX import Sudoku
+
+# Long-lived solver session for interactive play. Cells are (row, col) tuples as in Sudoku.
+# Domains are kept up to date by the solver's own assign and unassign, so queries do not
+# rebuild the solver or solve from scratch.
+
+class SudokuSession(object):
+    def __init__(self, puzzle):
+        self.solver = Sudoku(puzzle)
+        self.solver.initialise()
+        if self.solver.do_precheck:
+            self.solver.precheck()
+
+        self.puzzle = self.solver.puzzle
+        self.givens = set((i, j) for i in range(9) for j in range(9) if puzzle[i][j] != 0)
+        self.placed = []        # [(pos, val, assigned, consistent)] in the order the values were placed,
+                                # assigned is False for a value left on the grid without solver.assign
+        self.solution = None    # a solution of the current grid, kept until a placement disagrees
+        self.solvable = None    # None when unknown
+
+
+    def place(self, cell, value):
+        # returns False if propagation shows the grid can no longer be solved
+        if cell in self.givens:
+            raise ValueError("Cannot change a given cell: " + str(cell))
+        if not 1 <= value <= 9:
+            raise ValueError("Value must be between 1 and 9: " + str(value))
+
+        # checked before the cell is cleared, so a failed call leaves the grid unchanged
+        if self.solver.is_having_conflits(self.puzzle, cell, value):
+            raise ValueError(str(value) + " conflicts with a neighbour of " + str(cell))
+        if self.puzzle[cell[0]][cell[1]] != 0:
+            self.clear(cell)
+
+        entry = self.apply(cell, value)
+        self.placed.append(entry)
+        consistent = entry[3]
+
+        if self.solution is not None and self.solution[cell[0]][cell[1]] != value:
+            self.solution = None
+        if self.solution is None:
+            self.solvable = None if consistent else False
+        return consistent
+
+
+    def clear(self, cell):
+        # placements are undone in reverse order back to cell, then the later ones are replayed
+        if cell in self.givens:
+            raise ValueError("Cannot change a given cell: " + str(cell))
+        placed = [entry[0] for entry in self.placed]
+        if cell not in placed:
+            raise ValueError("Cell has no placed value to clear: " + str(cell))
+        index = placed.index(cell)
+        later = self.placed[index + 1:]
+
+        for pos, val, assigned, consistent in reversed(self.placed[index:]):
+            if assigned:
+                self.solver.unassign(self.puzzle, pos, val)
+            else:
+                self.puzzle[pos[0]][pos[1]] = 0
+        del self.placed[index:]
+
+        for pos, val, assigned, consistent in later:
+            self.placed.append(self.apply(pos, val))
+
+        # a solution of the old grid is still a solution once a cell is cleared
+        if self.solution is None:
+            self.solvable = None
+
+
+    def apply(self, pos, val):
+        # returns the entry for self.placed
+        if val not in self.solver.domains[pos]:
+            # ruled out by propagation, keep the value on the grid without propagating it
+            self.puzzle[pos[0]][pos[1]] = val
+            return (pos, val, False, False)
+        return (pos, val, True, self.solver.assign(self.puzzle, pos, val, self.solver.do_AC3))
+
+
+    def candidates(self, cell):
+        if self.puzzle[cell[0]][cell[1]] != 0:
+            return [self.puzzle[cell[0]][cell[1]]]
+        return sorted(self.solver.domains[cell])
+
+
+    def is_solvable(self):
+        if self.solvable is None:
+            if not all(consistent for pos, val, assigned, consistent in self.placed):
+                self.solvable = False
+            else:
+                # search with early cutoff at the first solution, every assignment is undone
+                self.solvable = self.solver.count_solutions(1) > 0
+                self.solution = self.solver.solution
+        return self.solvable
+
+
+    def next_hint(self):
+        # returns (cell, value), or None if the grid is complete or cannot be solved
+        if not self.is_solvable():
+            return None
+
+        # prefer a cell already forced by propagation
+        for i in range(9):
+            for j in range(9):
+                if self.puzzle[i][j] == 0 and len(self.solver.domains[(i, j)]) == 1:
+                    return ((i, j), self.solver.domains[(i, j)][0])
+
+        if self.solver.isComplete(self.puzzle):
+            return None
+
+        pos = self.solver.select_unassigned_var(self.puzzle)
+        return (pos, self.solution[pos[0]][pos[1]])
@@ -0,0 +1,192 @@
+import sys
+import struct
+
+from CS3243_P2_Sudoku_XX import SolveStats
+
+# Search tracers for the Sudoku solver. Attach one with sudoku.tracer = tracer before solve().
+# With no tracer attached the solver only pays a None check at each event site.
+
+TECHNIQUES = SolveStats.TECHNIQUES
+
+
+class Tracer(object):
+    # Interface of the events raised by Sudoku, every method is a no-op here.
+    # pos is a (row, col) tuple, depth is the number of cells assigned by the search.
+
+    def node(self, depth):
+        pass
+
+
+    def assign(self, pos, val, depth):
+        pass
+
+
+    def prune(self, pos, val, technique):
+        # technique is one of TECHNIQUES
+        pass
+
+
+    def revise(self, xi, xj, revised):
+        pass
+
+
+    def wipeout(self, pos):
+        pass
+
+
+    def backtrack(self, pos, val, depth):
+        pass
+
+
+    def solution(self, nodes):
+        pass
+
+
+    def close(self):
+        pass
+
+
+class BinaryTracer(Tracer):
+    # Writes every event as a 4 byte record: event code, cell, value and an extra byte
+    # holding the depth, technique index or revised flag. Cells are row * 9 + col.
+    NODE, ASSIGN, PRUNE, REVISE, WIPEOUT, BACKTRACK, SOLUTION = range(7)
+    EVENTS = ['node', 'assign', 'prune', 'revise', 'wipeout', 'backtrack', 'solution']
+    RECORD = struct.Struct('BBBB')
+    BUFFER_SIZE = 1 << 16
+
+    def __init__(self, path):
+        self.f = open(path, 'wb')
+        self.buffer = bytearray()
+
+
+    def write(self, event, cell, val, extra):
+        self.buffer += self.RECORD.pack(event, cell, val, min(extra, 255))
+        if len(self.buffer) >= self.BUFFER_SIZE:
+            self.f.write(self.buffer)
+            self.buffer = bytearray()
+
+
+    def node(self, depth):
+        self.write(self.NODE, 0, 0, depth)
+
+
+    def assign(self, pos, val, depth):
+        self.write(self.ASSIGN, pos[0] * 9 + pos[1], val, depth)
+
+
+    def prune(self, pos, val, technique):
+        self.write(self.PRUNE, pos[0] * 9 + pos[1], val, TECHNIQUES.index(technique))
+
+
+    def revise(self, xi, xj, revised):
+        self.write(self.REVISE, xi[0] * 9 + xi[1], xj[0] * 9 + xj[1], int(revised))
+
+
+    def wipeout(self, pos):
+        self.write(self.WIPEOUT, pos[0] * 9 + pos[1], 0, 0)
+
+
+    def backtrack(self, pos, val, depth):
+        self.write(self.BACKTRACK, pos[0] * 9 + pos[1], val, depth)
+
+
+    def solution(self, nodes):
+        self.write(self.SOLUTION, 0, 0, 0)
+
+
+    def close(self):
+        self.f.write(self.buffer)
+        self.buffer = bytearray()
+        self.f.close()
+
+
+def read_events(path):
+    # yields (event name, cell, value, extra) tuples from a BinaryTracer log
+    with open(path, 'rb') as f:
+        data = f.read()
+    for event, cell, val, extra in BinaryTracer.RECORD.iter_unpack(data):
+        yield BinaryTracer.EVENTS[event], cell, val, extra
+
+
+class SummaryTracer(Tracer):
+    # Counts events, prunings by technique, and the cells that wipe out or get backtracked most
+    def __init__(self):
+        self.counts = dict((event, 0) for event in BinaryTracer.EVENTS)
+        self.prunes = dict((technique, 0) for technique in TECHNIQUES)
+        self.revised = 0
+        self.max_depth = 0
+        self.wipeouts = dict()
+        self.backtracks = dict()
+
+
+    def node(self, depth):
+        self.counts['node'] += 1
+        self.max_depth = max(self.max_depth, depth)
+
+
+    def assign(self, pos, val, depth):
+        self.counts['assign'] += 1
+
+
+    def prune(self, pos, val, technique):
+        self.counts['prune'] += 1
+        self.prunes[technique] += 1
+
+
+    def revise(self, xi, xj, revised):
+        self.counts['revise'] += 1
+        if revised:
+            self.revised += 1
+
+
+    def wipeout(self, pos):
+        self.counts['wipeout'] += 1
+        self.wipeouts[pos] = self.wipeouts.get(pos, 0) + 1
+
+
+    def backtrack(self, pos, val, depth):
+        self.counts['backtrack'] += 1
+        self.backtracks[pos] = self.backtracks.get(pos, 0) + 1
+
+
+    def solution(self, nodes):
+        self.counts['solution'] += 1
+
+
+    def summary(self, top = 5):
+        lines = []
+        lines.append("events: " + ", ".join(e + "=" + str(self.counts[e]) for e in BinaryTracer.EVENTS))
+        lines.append("prunes: " + ", ".join(t + "=" + str(self.prunes[t]) for t in TECHNIQUES))
+        lines.append("arcs revised: " + str(self.revised) + "/" + str(self.counts['revise']))
+        lines.append("max depth: " + str(self.max_depth))
+        for name, table in (("wipeouts", self.wipeouts), ("backtracks", self.backtracks)):
+            worst = sorted(table.items(), key = lambda item: -item[1])[:top]
+            lines.append(name + ": " + ", ".join(str(pos) + "=" + str(n) for pos, n in worst))
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # python sudoku_trace.py trace.bin
+    # prints the summary of a binary event log
+    if len(sys.argv) != 2:
+        print ("\nUsage: python sudoku_trace.py trace.bin\n")
+        raise ValueError("Wrong number of arguments!")
+
+    summary = SummaryTracer()
+    for event, cell, val, extra in read_events(sys.argv[1]):
+        pos = (cell // 9, cell % 9)
+        if event == 'node':
+            summary.node(extra)
+        elif event == 'assign':
+            summary.assign(pos, val, extra)
+        elif event == 'prune':
+            summary.prune(pos, val, TECHNIQUES[extra])
+        elif event == 'revise':
+            summary.revise(pos, (val // 9, val % 9), extra)
+        elif event == 'wipeout':
+            summary.wipeout(pos)
+        elif event == 'backtrack':
+            summary.backtrack(pos, val, extra)
+        elif event == 'solution':
+            summary.solution(0)
+    print(summary.summary())